@@ -0,0 +1,85 @@
+import bisect
+import re
+
+MAX_RANGE_SIZE = 10000
+
+_RANGE_END = re.compile(r"^(.*?)(\d+)$")
+
+
+class BadgeFreeList:
+    """Available badge numbers per category, kept sorted and updated in place.
+
+    Loaded once from the badges table; check-ins and check-outs then take
+    and release single badges instead of re-reading the whole inventory.
+    The first free badge of a category is always at the front of its list.
+    """
+
+    def __init__(self):
+        self._free = {}
+        self._category = {}
+        self._values = None
+
+    def load(self, states):
+        """states are (badge_number, category, status) rows for every badge."""
+        self._free = {}
+        self._category = {}
+        for number, category, status in states:
+            self._category[number] = category
+            if status == "available":
+                self._free.setdefault(category, []).append(number)
+        for numbers in self._free.values():
+            numbers.sort()
+        self._values = None
+
+    def take(self, badge_number):
+        numbers = self._free.get(self._category.get(badge_number))
+        if numbers:
+            i = bisect.bisect_left(numbers, badge_number)
+            if i < len(numbers) and numbers[i] == badge_number:
+                del numbers[i]
+                self._values = None
+
+    def release(self, badge_number):
+        category = self._category.get(badge_number)
+        if category is None:
+            return
+        numbers = self._free.setdefault(category, [])
+        i = bisect.bisect_left(numbers, badge_number)
+        if i == len(numbers) or numbers[i] != badge_number:
+            numbers.insert(i, badge_number)
+            self._values = None
+
+    def is_free(self, badge_number):
+        numbers = self._free.get(self._category.get(badge_number), ())
+        i = bisect.bisect_left(numbers, badge_number)
+        return i < len(numbers) and numbers[i] == badge_number
+
+    def first(self, category):
+        numbers = self._free.get(category)
+        return numbers[0] if numbers else None
+
+    def numbers(self, category=None):
+        """Free badge numbers in one category, or all of them ordered by category."""
+        if category is not None:
+            return list(self._free.get(category, ()))
+        if self._values is None:
+            self._values = [n for c in sorted(self._free) for n in self._free[c]]
+        return self._values
+
+
+def expand_badge_range(first, last):
+    """Badge numbers from first to last inclusive, e.g. V-001..V-500.
+
+    Both ends must share a prefix and end in digits; zero padding follows
+    the first badge. Raises ValueError for anything else.
+    """
+    start, end = _RANGE_END.match(first.strip()), _RANGE_END.match(last.strip())
+    if not start or not end or start.group(1) != end.group(1):
+        raise ValueError("Both ends of the range need the same prefix followed by a number, e.g. V-001 and V-500.")
+    low, high = int(start.group(2)), int(end.group(2))
+    if high < low:
+        raise ValueError("The end of the range is before the start.")
+    if high - low + 1 > MAX_RANGE_SIZE:
+        raise ValueError(f"A range can add at most {MAX_RANGE_SIZE} badges at once.")
+    prefix, width = start.group(1), len(start.group(2))
+    return [f"{prefix}{n:0{width}d}" for n in range(low, high + 1)]
@@ -0,0 +1,261 @@
+"""Headless benchmark for the check-in core.
+
+Drives check-in, check-out, search, badge availability, bulk checkout and
+history export against a throwaway database populated with generated
+visitors and badges, then reports latency percentiles and memory per
+operation. Results are saved as JSON under benchmarks/results/ and compared
+with the previous run so regressions stand out between versions.
+
+    python benchmarks/bench_checkin.py --sizes 100 10000 100000
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkin_core import DEFAULT_KIOSK_CONFIG, CheckInCore  # noqa: E402
+from database import Database  # noqa: E402
+from history_export import export_history  # noqa: E402
+from history_query import init_history_search  # noqa: E402
+from visit_store import VisitRecord  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEFAULT_SIZES = (100, 10000, 100000)
+
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn",
+               "Kevin", "Maria", "Wei", "Priya", "Omar", "Lena", "Hiro", "Ana", "Noah", "Zoe"]
+LAST_NAMES = ["Nguyen", "Smith", "Garcia", "Chen", "Patel", "Kim", "Lopez", "Brown", "Ito", "Khan",
+              "Martin", "Silva", "Novak", "Okafor", "Rossi", "Jensen", "Cohen", "Dubois", "Park", "Ali"]
+COMPANIES = ["Acme Foods", "Globex", "Initech", "Umbrella Supply", "Stark Refrigeration", "Wayne Logistics",
+             "Hooli", "Soylent", "Tyrell Electric", "Vandelay Imports"]
+AREAS = ["Kitchen", "Warehouse", "Office", "Loading Dock", "Freezer", "Lab", "Front Desk"]
+REASONS = ["Delivery", "Maintenance", "Interview", "Audit", "Meeting", "Inspection", "Repair"]
+CATEGORIES = ["Visitor", "Contractor", "Temporary"]
+
+
+# --- Generators ---
+def generate_badges(count):
+    prefixes = {"Visitor": "V", "Contractor": "C", "Temporary": "T"}
+    return [(f"{prefixes[CATEGORIES[i % 3]]}-{i:06d}", CATEGORIES[i % 3]) for i in range(count)]
+
+
+def generate_visitors(rng, count, badges, start=None):
+    start = start or datetime(2025, 1, 1, 8, 0, 0)
+    free = [b for b, _ in badges]
+    rng.shuffle(free)
+    for i in range(count):
+        badge_id = free.pop() if free and rng.random() < 0.5 else ""
+        yield VisitRecord(
+            id=str(uuid.UUID(int=rng.getrandbits(128))),
+            name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            company=rng.choice(COMPANIES),
+            badge_id=badge_id,
+            reason_of_visit=rng.choice(REASONS),
+            area=rng.choice(AREAS),
+            time_in=(start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+            face_file=f"faces/{i:08x}.jpg",
+            driver_license_file=f"Driver License/{i:08x}.jpg",
+        )
+
+
+def generate_search_terms(rng, count):
+    pool = FIRST_NAMES + LAST_NAMES + COMPANIES + AREAS + REASONS
+    terms = []
+    for _ in range(count):
+        word = rng.choice(pool).lower()
+        terms.append(word[:rng.randint(1, len(word))])
+    return terms
+
+
+def generate_frames(rng, count, width=1280, height=720):
+    import numpy as np
+    np_rng = np.random.default_rng(rng.randint(0, 2 ** 32 - 1))
+    return [np_rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+
+# --- Measurement ---
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is KiB on Linux, bytes on macOS; either way it is only a peak
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class OperationTimer:
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+        self.rss_before = current_rss_bytes()
+        self.rss_after = None
+
+    def time(self, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.samples.append((time.perf_counter() - start) * 1000)
+        return result
+
+    def finish(self):
+        self.rss_after = current_rss_bytes()
+        samples = sorted(self.samples)
+        return {
+            "count": len(samples),
+            "total_ms": round(sum(samples), 3),
+            "p50_ms": round(percentile(samples, 50), 4),
+            "p95_ms": round(percentile(samples, 95), 4),
+            "p99_ms": round(percentile(samples, 99), 4),
+            "max_ms": round(samples[-1], 4) if samples else 0.0,
+            "rss_delta_kib": (self.rss_after - self.rss_before) // 1024,
+        }
+
+
+# --- Scenario ---
+def run_size(size, seed, workdir, with_encode):
+    rng = random.Random(seed)
+    db = Database(os.path.join(workdir, "bench.db"))
+    db.init_schema()
+    init_history_search(db)
+    badges = generate_badges(size)
+    with db.transaction() as conn:
+        conn.executemany("INSERT INTO badges (badge_number, category) VALUES (?, ?)", badges)
+
+    core = CheckInCore(db, DEFAULT_KIOSK_CONFIG,
+                       os.path.join(workdir, "checkin_records.json"),
+                       os.path.join(workdir, "checkin_records.journal"))
+    core.load()
+    results = {}
+
+    timer = OperationTimer("check_in")
+    for record in generate_visitors(rng, size, badges):
+        timer.time(core.check_in, record)
+    results["check_in"] = timer.finish()
+
+    timer = OperationTimer("perform_search")
+    for term in generate_search_terms(rng, 200):
+        timer.time(core.search, term)
+    results["perform_search"] = timer.finish()
+
+    timer = OperationTimer("update_available_badges")
+    for _ in range(20):
+        timer.time(core.available_badges)
+    results["update_available_badges"] = timer.finish()
+
+    timer = OperationTimer("check_out")
+    ids = [r.id for r in core.visits]
+    rng.shuffle(ids)
+    time_out = datetime(2025, 6, 1, 17, 0, 0).strftime("%Y-%m-%d %H:%M:%S")
+    # Leave at least half the guests on site so checkout_all has real work
+    for record_id in ids[:min(len(ids) // 2, 1000)]:
+        timer.time(core.check_out, record_id, time_out)
+    results["check_out"] = timer.finish()
+
+    timer = OperationTimer("checkout_all_guests")
+    timer.time(core.check_out_all, time_out)
+    results["checkout_all_guests"] = timer.finish()
+
+    timer = OperationTimer("export_history_to_csv")
+    timer.time(export_history, db, os.path.join(workdir, "export.csv"))
+    results["export_history_to_csv"] = timer.finish()
+
+    if with_encode:
+        from image_encoder import DEFAULT_IMAGE_CONFIG, ImageEncoder
+        from image_store import ImageStore
+        encoder = ImageEncoder(DEFAULT_IMAGE_CONFIG)
+        store = ImageStore(os.path.join(workdir, "faces"))
+        timer = OperationTimer("encode_image")
+        for frame in generate_frames(rng, 10):
+            timer.time(lambda f: encoder.submit(f, store).result(), frame)
+        encoder.shutdown()
+        results["encode_image"] = timer.finish()
+
+    core.close()
+    db.close()
+    return results
+
+
+# --- Reporting ---
+def print_report(run, previous=None):
+    for size, ops in run["sizes"].items():
+        print(f"\n== {size} records ==")
+        print(f"{'operation':<26}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'rss KiB':>10}")
+        for op, stats in ops.items():
+            line = (f"{op:<26}{stats['count']:>8}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}"
+                    f"{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}{stats['rss_delta_kib']:>10}")
+            old = (previous or {}).get("sizes", {}).get(size, {}).get(op)
+            if old and old["p95_ms"]:
+                change = (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+                line += f"  p95 {change:+.0f}%"
+            print(line)
+
+
+def latest_result(exclude=None):
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    files = sorted(f for f in os.listdir(RESULTS_DIR) if f.endswith(".json") and f != exclude)
+    if not files:
+        return None
+    with open(os.path.join(RESULTS_DIR, files[-1])) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--label", default="", help="tag stored with the results, e.g. a version")
+    parser.add_argument("--encode", action="store_true", help="also benchmark image encoding (needs OpenCV)")
+    parser.add_argument("--baseline", help="results file to compare against (default: most recent)")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    run = {
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": {},
+    }
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix="guest-bench-")
+        try:
+            run["sizes"][str(size)] = run_size(size, args.seed, workdir, args.encode)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            previous = json.load(f)
+    else:
+        previous = latest_result()
+    print_report(run, previous)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}{'_' + args.label if args.label else ''}.json"
+        with open(os.path.join(RESULTS_DIR, name), 'w') as f:
+            json.dump(run, f, indent=4)
+        print(f"\nResults saved to {os.path.join(RESULTS_DIR, name)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+
+from instrumentation import metrics
+
+CAMERA_INDEX = 0
+IDLE_RELEASE_SECONDS = 300
+PREVIEW_WIDTH = 640
+
+
+class CameraService:
+    """Keeps the webcam open on a background thread and holds its latest frame.
+
+    Opening a capture device can take seconds, so the device is opened once
+    and kept warm between guests; it is released after IDLE_RELEASE_SECONDS
+    without anyone asking for a frame. While a preview is active the grabber
+    thread also prepares a downscaled RGB copy for display.
+    """
+
+    def __init__(self, index=CAMERA_INDEX, idle_release=IDLE_RELEASE_SECONDS, preview_width=PREVIEW_WIDTH):
+        self.index = index
+        self.idle_release = idle_release
+        self.preview_width = preview_width
+        self.error = None
+        self.preview_active = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._frame = None
+        self._preview = None
+        self._frame_id = 0
+        self._last_used = time.monotonic()
+
+    def start(self):
+        self._last_used = time.monotonic()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.error = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="camera", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self):
+        # OpenCV is imported here, off the UI thread, the first time the camera is used
+        import cv2
+        start = time.perf_counter()
+        cap = cv2.VideoCapture(self.index)
+        try:
+            if not cap.isOpened():
+                self.error = "Could not open webcam."
+                logging.error(f"Could not open camera {self.index}.")
+                return
+            open_ms = (time.perf_counter() - start) * 1000
+            metrics.observe("camera.open", open_ms)
+            logging.info(f"Camera {self.index} opened in {open_ms:.0f} ms.")
+            while not self._stop.is_set():
+                ok, frame = cap.read()
+                if not ok:
+                    time.sleep(0.05)
+                    continue
+                preview = self._make_preview(frame) if self.preview_active else None
+                with self._lock:
+                    self._frame = frame
+                    self._preview = preview
+                    self._frame_id += 1
+                if not self.preview_active and time.monotonic() - self._last_used > self.idle_release:
+                    logging.info("Releasing idle camera.")
+                    break
+        finally:
+            cap.release()
+            with self._lock:
+                self._frame = None
+                self._preview = None
+
+    def _make_preview(self, frame):
+        import cv2
+        height, width = frame.shape[:2]
+        if width > self.preview_width:
+            frame = cv2.resize(frame, (self.preview_width, int(height * self.preview_width / width)),
+                               interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def latest_preview(self):
+        """Return (frame_id, rgb_preview) for the newest frame, or (frame_id, None)."""
+        self._last_used = time.monotonic()
+        with self._lock:
+            return self._frame_id, self._preview
+
+    def grab(self):
+        """Return a copy of the newest full-resolution BGR frame, or None."""
+        self._last_used = time.monotonic()
+        with self._lock:
+            if self._frame is None:
+                return None
+            metrics.increment("camera.captures")
+            return self._frame.copy()
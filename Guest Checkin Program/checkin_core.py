@@ -0,0 +1,381 @@
+import json
+import logging
+import sqlite3
+
+import rollups
+from badge_pool import BadgeFreeList
+from instrumentation import metrics
+from journal import CheckinJournal
+from search_index import SearchIndex
+from visit_store import ActiveVisitStore, VisitRecord
+
+DEFAULT_KIOSK_CONFIG = {
+    # "local": active visits in this station's checkin_records.json journal.
+    # "shared": active visits in the shared database so several stations can
+    # run against one store.
+    "backend": "local",
+    "shared_db_path": "",
+    # WAL needs shared memory on one host; network shares need DELETE.
+    "shared_journal_mode": "DELETE",
+    # Open the camera (and load OpenCV) in the background after launch.
+    # When false, OpenCV is not loaded until the first capture.
+    "prewarm_camera": True,
+    # Closed visits from months older than this move to per-month archive
+    # databases under history_archive_dir (default: archive/history).
+    "history_archive_days": 365,
+    "history_archive_dir": "",
+}
+
+
+class BadgeUnavailableError(Exception):
+    pass
+
+
+def load_kiosk_config(path):
+    config = dict(DEFAULT_KIOSK_CONFIG)
+    try:
+        with open(path, 'r') as f:
+            config.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except json.JSONDecodeError:
+        logging.warning("Kiosk config file is invalid. Using the local backend.")
+    return config
+
+
+class LocalVisitBackend:
+    """Active visits journalled to a per-station JSON snapshot."""
+
+    def __init__(self, db, visits, snapshot_path, journal_path):
+        self.db = db
+        self.visits = visits
+        self.journal = CheckinJournal(snapshot_path, journal_path, lambda: (r.to_dict() for r in visits))
+
+    def load(self):
+        records, needs_compaction = self.journal.load()
+        return [VisitRecord.from_dict(r) for r in records], needs_compaction
+
+    def compact(self):
+        self.journal.compact()
+
+    def compact_if_due(self):
+        self.journal.compact_if_due()
+
+    def reconcile(self, records):
+        # The journal and the database are separate files, so a crash can
+        # leave badge states and occupancy behind the journal; the journal wins.
+        with self.db.transaction() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS held_badges (badge_number TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM held_badges")
+            conn.executemany("INSERT OR IGNORE INTO held_badges VALUES (?)",
+                             ((r.badge_id,) for r in records if r.badge_id))
+            self.db.sync_issued_badges(conn, "SELECT badge_number FROM held_badges")
+            rollups.backfill(conn, records)
+            rollups.sync_occupancy(conn, records)
+
+    def add(self, record):
+        with self.db.transaction() as conn:
+            if record.badge_id and not self.db.issue_badge(conn, record.badge_id):
+                raise BadgeUnavailableError(record.badge_id)
+            rollups.record_check_ins(conn, [record])
+        try:
+            self.journal.check_in(record.to_dict())
+        except Exception:
+            self._release([record])
+            raise
+
+    def add_many(self, records):
+        with self.db.transaction() as conn:
+            accepted = [r for r in records if not r.badge_id or self.db.issue_badge(conn, r.badge_id)]
+            rollups.record_check_ins(conn, accepted)
+        if accepted:
+            try:
+                self.journal.check_in_many(r.to_dict() for r in accepted)
+            except Exception:
+                self._release(accepted)
+                raise
+        return accepted
+
+    def _release(self, records):
+        # Undo the database side of a check-in the journal did not record
+        with self.db.transaction() as conn:
+            self.db.release_badges(conn, [r.badge_id for r in records])
+            rollups.sync_occupancy(conn, self.visits)
+
+    def remove(self, record, time_out):
+        # Journal first: a failed journal write must not leave history
+        # written and the badge released for a guest who is still active
+        self.journal.check_out(record.id)
+        try:
+            self.db.insert_history(record, time_out)
+        except Exception:
+            self.journal.check_in(record.to_dict())
+            raise
+        return True
+
+    def remove_all(self, records, time_out):
+        self.journal.check_out_all()
+        try:
+            self.db.insert_history_many(records, time_out)
+        except Exception:
+            self.journal.check_in_many(r.to_dict() for r in records)
+            raise
+
+    def changed(self):
+        return False
+
+    def sync(self):
+        self.journal.sync()
+
+    def close(self):
+        self.journal.close()
+
+
+class SharedVisitBackend:
+    """Active visits kept in an active_visits table of a shared database.
+
+    A unique index on badge_id makes badge claims atomic across stations:
+    the second station to insert the same badge gets an IntegrityError.
+    Check-out deletes the active row and writes history in one transaction,
+    so two stations cannot check the same guest out twice.
+    """
+
+    COLUMNS = VisitRecord.__slots__
+
+    def __init__(self, db):
+        self.db = db
+        self._schema_ready = False
+        self._data_version = None
+
+    def _create_schema(self):
+        with self.db.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS active_visits (
+                    id TEXT PRIMARY KEY, name TEXT NOT NULL, company TEXT, badge_id TEXT,
+                    reason_of_visit TEXT, area TEXT, time_in TEXT,
+                    face_file TEXT, driver_license_file TEXT
+                )
+            ''')
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_active_badge "
+                         "ON active_visits (badge_id) WHERE badge_id != ''")
+        self._schema_ready = True
+
+    def load(self):
+        if not self._schema_ready:
+            self._create_schema()
+        records = self._active_records(self.db.connection())
+        self._data_version = self._current_data_version()
+        return records, False
+
+    def _active_records(self, conn):
+        rows = conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM active_visits ORDER BY time_in, rowid")
+        return [VisitRecord(*row) for row in rows]
+
+    def reconcile(self, records):
+        # Re-read under the write lock so other stations cannot change the set meanwhile
+        with self.db.transaction(immediate=True) as conn:
+            self.db.sync_issued_badges(
+                conn, "SELECT badge_id FROM active_visits WHERE badge_id IS NOT NULL AND badge_id != ''")
+            active = self._active_records(conn)
+            rollups.backfill(conn, active)
+            rollups.sync_occupancy(conn, active)
+
+    def compact(self):
+        pass
+
+    def compact_if_due(self):
+        pass
+
+    def _insert(self, conn, record):
+        conn.execute(f"INSERT INTO active_visits ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                     [getattr(record, c) for c in self.COLUMNS])
+
+    def add(self, record):
+        try:
+            with self.db.transaction(immediate=True) as conn:
+                if record.badge_id and not self.db.issue_badge(conn, record.badge_id):
+                    raise BadgeUnavailableError(record.badge_id)
+                self._insert(conn, record)
+                rollups.record_check_ins(conn, [record])
+        except sqlite3.IntegrityError:
+            raise BadgeUnavailableError(record.badge_id)
+
+    def add_many(self, records):
+        accepted = []
+        with self.db.transaction(immediate=True) as conn:
+            for record in records:
+                if record.badge_id and not self.db.issue_badge(conn, record.badge_id):
+                    continue
+                try:
+                    self._insert(conn, record)
+                except sqlite3.IntegrityError:
+                    self.db.release_badges(conn, [record.badge_id])
+                    continue
+                accepted.append(record)
+            rollups.record_check_ins(conn, accepted)
+        return accepted
+
+    def remove(self, record, time_out):
+        with self.db.transaction(immediate=True) as conn:
+            if conn.execute("DELETE FROM active_visits WHERE id = ?", (record.id,)).rowcount == 0:
+                # Another station already checked this guest out
+                return False
+            conn.execute(self.db.INSERT_HISTORY_SQL, self.db.history_row(record, time_out))
+            self.db.release_badges(conn, [record.badge_id])
+            rollups.record_check_outs(conn, [record], time_out)
+        return True
+
+    def remove_all(self, records, time_out):
+        with self.db.transaction(immediate=True) as conn:
+            # Includes guests other stations checked in since the last refresh
+            active = self._active_records(conn)
+            conn.executemany(self.db.INSERT_HISTORY_SQL, (self.db.history_row(r, time_out) for r in active))
+            self.db.release_badges(conn, [r.badge_id for r in active])
+            rollups.record_check_outs(conn, active, time_out)
+            conn.execute("DELETE FROM active_visits")
+
+    def _current_data_version(self):
+        return self.db.query("PRAGMA data_version")[0][0]
+
+    def changed(self):
+        # data_version moves when any other connection commits to the file
+        version = self._current_data_version()
+        if version != self._data_version:
+            self._data_version = version
+            return True
+        return False
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class CheckInCore:
+    """Headless check-in logic shared by the Tk front end and tools.
+
+    Owns the indexed active-visit store and its search index, and persists
+    every change through the configured backend.
+    """
+
+    def __init__(self, db, config, snapshot_path, journal_path):
+        self.db = db
+        self.visits = ActiveVisitStore()
+        self.search_index = SearchIndex()
+        self.badges = BadgeFreeList()
+        if config["backend"] == "shared":
+            self.backend = SharedVisitBackend(db)
+        else:
+            self.backend = LocalVisitBackend(db, self.visits, snapshot_path, journal_path)
+
+    def load(self):
+        records, needs_compaction = self.backend.load()
+        self.backend.reconcile(records)
+        self._replace_all(records)
+        self.reload_badges()
+        if needs_compaction:
+            self.backend.compact()
+
+    def reload_badges(self):
+        """Re-read badge states after inventory edits or changes from other stations."""
+        self.badges.load(self.db.badge_states())
+
+    def _replace_all(self, records):
+        self.visits.clear()
+        self.search_index.clear()
+        for record in records:
+            self._index(record)
+
+    def _index(self, record):
+        self.visits.add(record)
+        self.search_index.add(record)
+
+    def _unindex(self, record_id):
+        self.visits.remove(record_id)
+        self.search_index.remove(record_id)
+
+    def refresh(self):
+        """Pick up changes made by other stations. Returns True if anything changed."""
+        if not self.backend.changed():
+            return False
+        records, _ = self.backend.load()
+        wanted = {r.id: r for r in records}
+        for record in list(self.visits):
+            if record.id not in wanted:
+                self._unindex(record.id)
+        for record in records:
+            if record.id not in self.visits:
+                self._index(record)
+        self.reload_badges()
+        return True
+
+    def check_in(self, record):
+        with metrics.timed("core.check_in"):
+            self.backend.add(record)
+            self._index(record)
+            self.badges.take(record.badge_id)
+            self.backend.compact_if_due()
+        metrics.increment("visits.checked_in")
+        return record
+
+    def check_in_many(self, records):
+        with metrics.timed("core.check_in_many"):
+            accepted = self.backend.add_many(records)
+            for record in accepted:
+                self._index(record)
+                self.badges.take(record.badge_id)
+            self.backend.compact_if_due()
+        metrics.increment("visits.checked_in", len(accepted))
+        return accepted
+
+    def check_out(self, record_id, time_out):
+        record = self.visits.get(record_id)
+        if record is None:
+            return None
+        with metrics.timed("core.check_out"):
+            done = self.backend.remove(record, time_out)
+            self._unindex(record_id)
+            if done:
+                self.badges.release(record.badge_id)
+            self.backend.compact_if_due()
+        if not done:
+            return None
+        metrics.increment("visits.checked_out")
+        return record
+
+    def check_out_all(self, time_out):
+        count = len(self.visits)
+        with metrics.timed("core.check_out_all"):
+            records = list(self.visits)
+            self.backend.remove_all(records, time_out)
+            for record in records:
+                self.badges.release(record.badge_id)
+            self.visits.clear()
+            self.search_index.clear()
+            self.backend.compact_if_due()
+        metrics.increment("visits.checked_out", count)
+        return count
+
+    def search(self, term):
+        with metrics.timed("core.search"):
+            matching_ids = self.search_index.search(term)
+            if matching_ids is None:
+                return list(self.visits)
+            return [self.visits.get(i) for i in matching_ids]
+
+    def available_badges(self, category=None):
+        with metrics.timed("core.available_badges"):
+            return self.badges.numbers(category)
+
+    def next_badge(self, category):
+        return self.badges.first(category)
+
+    def badge_available(self, badge_number):
+        return self.badges.is_free(badge_number)
+
+    def sync(self):
+        self.backend.sync()
+
+    def close(self):
+        self.backend.close()
@@ -0,0 +1,185 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import rollups
+from instrumentation import metrics
+
+# Per-connection pragmas. WAL lets readers and the writer run concurrently and,
+# with synchronous=NORMAL, only fsyncs at checkpoints instead of every commit.
+PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8192",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+STATEMENT_CACHE_SIZE = 128
+BADGE_STATUSES = ("available", "issued", "lost", "retired")
+
+
+class Database:
+    """Long-lived SQLite connections for badge_inventory.db, one per thread.
+
+    Connections are created on first use by each thread and kept open, so the
+    UI thread and any worker threads each reuse a warm connection with its
+    prepared-statement cache instead of reconnecting per operation.
+    """
+
+    def __init__(self, path, journal_mode="WAL"):
+        self.path = path
+        self.journal_mode = journal_mode
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, cached_statements=STATEMENT_CACHE_SIZE,
+                                   check_same_thread=False)
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        conn = self.connection()
+        with metrics.timed("db.transaction"), conn:
+            if immediate:
+                # Take the write lock up front so concurrent writers queue on busy_timeout
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+
+    def execute(self, sql, params=()):
+        with self.transaction() as conn:
+            return conn.execute(sql, params)
+
+    def query(self, sql, params=()):
+        with metrics.timed("db.query"):
+            return self.connection().execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+    # --- Schema ---
+    def init_schema(self):
+        with self.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS badges (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    badge_number TEXT NOT NULL UNIQUE,
+                    category TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    status TEXT NOT NULL DEFAULT 'available'
+                        CHECK (status IN ('available', 'issued', 'lost', 'retired'))
+                )
+            ''')
+            if "status" not in {row[1] for row in conn.execute("PRAGMA table_info(badges)")}:
+                # Databases from before badge states; the check-in core marks
+                # badges held by active visits as issued when it loads.
+                conn.execute("ALTER TABLE badges ADD COLUMN status TEXT NOT NULL DEFAULT 'available' "
+                             "CHECK (status IN ('available', 'issued', 'lost', 'retired'))")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_badges_status_category "
+                         "ON badges (status, category, badge_number)")
+            rollups.create_tables(conn)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS visitor_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, company TEXT, badge_id TEXT,
+                    reason_of_visit TEXT, area TEXT, time_in TEXT, time_out TEXT,
+                    face_file TEXT, driver_license_file TEXT
+                )
+            ''')
+
+    # --- Badges ---
+    def badge_states(self):
+        """(badge_number, category, status) for every badge."""
+        return self.query("SELECT badge_number, category, status FROM badges")
+
+    def badges_in_category(self, category):
+        return self.query(
+            "SELECT id, badge_number, category, status, created_at FROM badges WHERE category = ? "
+            "ORDER BY created_at DESC, id DESC",
+            (category,))
+
+    def insert_badge(self, badge_number, category):
+        self.execute("INSERT INTO badges (badge_number, category) VALUES (?, ?)", (badge_number, category))
+
+    def insert_badges(self, badge_numbers, category):
+        """Add many badges in one transaction, skipping numbers that already exist.
+
+        Returns the number of badges added.
+        """
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO badges (badge_number, category) VALUES (?, ?)",
+                             ((number, category) for number in badge_numbers))
+            return conn.total_changes - before
+
+    def delete_badge(self, badge_id):
+        """Delete a badge unless it is issued to an active visit. Returns True if deleted."""
+        return self.execute("DELETE FROM badges WHERE id = ? AND status != 'issued'", (badge_id,)).rowcount > 0
+
+    def set_badge_status(self, badge_id, status):
+        """Mark a badge available, lost or retired. Issued badges are left alone."""
+        if status not in BADGE_STATUSES or status == "issued":
+            raise ValueError(f"Cannot set badge status to {status!r}")
+        return self.execute("UPDATE badges SET status = ? WHERE id = ? AND status != 'issued'",
+                            (status, badge_id)).rowcount > 0
+
+    @staticmethod
+    def issue_badge(conn, badge_number):
+        """Claim an available badge inside the caller's transaction. Returns False if it is not available."""
+        return conn.execute("UPDATE badges SET status = 'issued' WHERE badge_number = ? AND status = 'available'",
+                            (badge_number,)).rowcount > 0
+
+    @staticmethod
+    def sync_issued_badges(conn, held_badges_sql):
+        """Mark exactly the badges selected by held_badges_sql as issued.
+
+        Lost and retired badges keep their status even if a visit holds them.
+        """
+        conn.execute(f"UPDATE badges SET status = 'available' "
+                     f"WHERE status = 'issued' AND badge_number NOT IN ({held_badges_sql})")
+        conn.execute(f"UPDATE badges SET status = 'issued' "
+                     f"WHERE status = 'available' AND badge_number IN ({held_badges_sql})")
+
+    @staticmethod
+    def release_badges(conn, badge_numbers):
+        """Return issued badges to the pool inside the caller's transaction."""
+        conn.executemany("UPDATE badges SET status = 'available' WHERE badge_number = ? AND status = 'issued'",
+                         ((number,) for number in badge_numbers if number))
+
+    # --- Visitor history ---
+    INSERT_HISTORY_SQL = """
+        INSERT INTO visitor_history (name, company, badge_id, reason_of_visit, area, time_in, time_out, face_file, driver_license_file)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    @staticmethod
+    def history_row(record, time_out):
+        return (record.name, record.company, record.badge_id, record.reason_of_visit, record.area,
+                record.time_in, time_out, record.face_file, record.driver_license_file)
+
+    def insert_history(self, record, time_out):
+        """Close a visit: write its history row, release its badge and count it in one transaction."""
+        with self.transaction() as conn:
+            conn.execute(self.INSERT_HISTORY_SQL, self.history_row(record, time_out))
+            self.release_badges(conn, [record.badge_id])
+            rollups.record_check_outs(conn, [record], time_out)
+
+    def insert_history_many(self, records, time_out):
+        with self.transaction() as conn:
+            conn.executemany(self.INSERT_HISTORY_SQL, (self.history_row(r, time_out) for r in records))
+            self.release_badges(conn, [r.badge_id for r in records])
+            rollups.record_check_outs(conn, records, time_out)
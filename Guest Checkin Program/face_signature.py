@@ -0,0 +1,259 @@
+"""Compact face signatures for recognising returning visitors.
+
+A signature is a 64-bit perceptual hash of the largest face found by
+OpenCV's bundled Haar cascade: the face crop is normalised to 32x32 grey,
+transformed with a DCT, and the low-frequency 8x8 coefficients are
+thresholded at their median. Similar faces give hashes a small Hamming
+distance apart.
+
+Signatures live in badge_inventory.db next to visitor_history. Each hash is
+also split into eight 8-bit bands stored in an indexed table, so a lookup
+only compares against visits that share at least one band with the query
+(locality-sensitive hashing) instead of scanning every past visit.
+
+Backfill signatures for existing history from the command line with:
+
+    python face_signature.py badge_inventory.db
+"""
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import metrics
+
+FACE_SIZE = 32
+HASH_SIZE = 8
+BAND_BITS = 8
+BANDS = HASH_SIZE * HASH_SIZE // BAND_BITS
+# Up to BANDS - 1 differing bits always share a band; a little above that is
+# still found most of the time.
+MATCH_DISTANCE = 10
+MIN_FACE_SIZE = 60
+BACKFILL_BATCH_SIZE = 200
+
+_cascade = None
+
+
+def _face_cascade():
+    """The bundled frontal-face cascade, or None if this OpenCV build lacks it."""
+    global _cascade
+    if _cascade is None:
+        import cv2
+        try:
+            cascade = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+        except (AttributeError, cv2.error):
+            cascade = None
+        if cascade is None or cascade.empty():
+            logging.warning("OpenCV face cascade not available; returning-visitor recognition is disabled.")
+            cascade = False
+        _cascade = cascade
+    return _cascade or None
+
+
+def compute_signature(image):
+    """Return the 64-bit signature of the largest face in a BGR image, or None."""
+    import cv2
+    import numpy as np
+    with metrics.timed("face.signature"):
+        cascade = _face_cascade()
+        if cascade is None:
+            return None
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5,
+                                         minSize=(MIN_FACE_SIZE, MIN_FACE_SIZE))
+        if len(faces) == 0:
+            return None
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        face = cv2.resize(gray[y:y + h, x:x + w], (FACE_SIZE, FACE_SIZE), interpolation=cv2.INTER_AREA)
+        face = cv2.equalizeHist(face)
+        coefficients = cv2.dct(np.float32(face))[:HASH_SIZE, :HASH_SIZE].flatten()
+        # The DC term only tracks overall brightness, so leave it out of the median
+        bits = coefficients > np.median(coefficients[1:])
+        signature = 0
+        for bit in bits:
+            signature = (signature << 1) | int(bit)
+        return signature
+
+
+def signature_from_file(path):
+    """Signature for an image on disk; None if it is missing, unreadable or has no face."""
+    import cv2
+    image = cv2.imread(path) if path and os.path.exists(path) else None
+    if image is None:
+        return None
+    try:
+        return compute_signature(image)
+    except cv2.error:
+        return None
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _to_sql(signature):
+    # SQLite integers are signed 64-bit
+    return signature - (1 << 64) if signature >= 1 << 63 else signature
+
+
+def _from_sql(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def _bands(signature):
+    mask = (1 << BAND_BITS) - 1
+    return [(band, (signature >> (band * BAND_BITS)) & mask) for band in range(BANDS)]
+
+
+class FaceSignatureIndex:
+    """Face signatures of past visits with an LSH band index for fast lookups."""
+
+    def __init__(self, db):
+        self.db = db
+        with db.transaction() as conn:
+            # signature is NULL for images where no face was found, so the
+            # backfill does not retry them
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS face_signatures (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    signature INTEGER,
+                    face_file TEXT UNIQUE,
+                    name TEXT NOT NULL, company TEXT, area TEXT, reason_of_visit TEXT,
+                    seen_at TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS face_signature_bands (
+                    band INTEGER NOT NULL, value INTEGER NOT NULL, signature_id INTEGER NOT NULL,
+                    PRIMARY KEY (band, value, signature_id)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_face_bands_signature ON face_signature_bands (signature_id)")
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS face_signatures_ad AFTER DELETE ON face_signatures BEGIN
+                    DELETE FROM face_signature_bands WHERE signature_id = old.id;
+                END
+            ''')
+
+    @staticmethod
+    def _insert(conn, signature, face_file, name, company, area, reason_of_visit, seen_at):
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO face_signatures (signature, face_file, name, company, area, reason_of_visit, seen_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (None if signature is None else _to_sql(signature), face_file, name, company, area, reason_of_visit, seen_at))
+        if cur.rowcount and signature is not None:
+            conn.executemany("INSERT INTO face_signature_bands (band, value, signature_id) VALUES (?, ?, ?)",
+                             [(band, value, cur.lastrowid) for band, value in _bands(signature)])
+
+    def add(self, signature, record):
+        with self.db.transaction() as conn:
+            self._insert(conn, signature, record.face_file, record.name, record.company,
+                         record.area, record.reason_of_visit, record.time_in)
+
+    def add_many(self, rows):
+        """rows are (signature, face_file, name, company, area, reason_of_visit, seen_at)."""
+        with self.db.transaction() as conn:
+            for row in rows:
+                self._insert(conn, *row)
+
+    def lookup(self, signature, max_distance=MATCH_DISTANCE, limit=5):
+        """Past visitors whose face is within max_distance bits, closest and most recent first.
+
+        Returns dicts with name, company, area, reason_of_visit, seen_at and
+        distance, one per distinct name and company.
+        """
+        with metrics.timed("face.lookup"):
+            bands = _bands(signature)
+            rows = self.db.query(f'''
+                SELECT s.signature, s.name, s.company, s.area, s.reason_of_visit, s.seen_at
+                FROM face_signatures s
+                WHERE s.id IN (
+                    SELECT signature_id FROM face_signature_bands
+                    WHERE {" OR ".join(["(band = ? AND value = ?)"] * len(bands))}
+                )
+            ''', [v for band in bands for v in band])
+            matches = []
+            for stored, name, company, area, reason, seen_at in rows:
+                distance = hamming_distance(signature, _from_sql(stored))
+                if distance <= max_distance:
+                    matches.append({"name": name, "company": company, "area": area,
+                                    "reason_of_visit": reason, "seen_at": seen_at or "", "distance": distance})
+            matches.sort(key=lambda m: m["seen_at"], reverse=True)
+            matches.sort(key=lambda m: m["distance"])
+            best, seen = [], set()
+            for match in matches:
+                key = (match["name"].lower(), (match["company"] or "").lower())
+                if key not in seen:
+                    seen.add(key)
+                    best.append(match)
+            return best[:limit]
+
+    def unsigned_history(self, after_id=0, limit=BACKFILL_BATCH_SIZE):
+        """Next past visits, by history id, whose face image has no signature row yet."""
+        return self.db.query('''
+            SELECT h.id, h.face_file, h.name, h.company, h.area, h.reason_of_visit, h.time_in
+            FROM visitor_history h
+            WHERE h.id > ? AND h.face_file != ''
+              AND NOT EXISTS (SELECT 1 FROM face_signatures s WHERE s.face_file = h.face_file)
+            ORDER BY h.id LIMIT ?
+        ''', (after_id, limit))
+
+    def unsigned_count(self):
+        return self.db.query('''
+            SELECT COUNT(*) FROM visitor_history h
+            WHERE h.face_file != ''
+              AND NOT EXISTS (SELECT 1 FROM face_signatures s WHERE s.face_file = h.face_file)
+        ''')[0][0]
+
+
+def backfill_signatures(index, workers=None, batch_size=BACKFILL_BATCH_SIZE, progress=None):
+    """Compute signatures for past visits that have none, on a process pool.
+
+    Images are decoded and hashed in worker processes a batch at a time;
+    each batch is written in one transaction. progress(done, total) is
+    called after every batch. Returns (processed, with_face).
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, batch_size // (4 * workers))
+    total = index.unsigned_count()
+    done = found = 0
+    after_id = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            rows = index.unsigned_history(after_id, batch_size)
+            if not rows:
+                break
+            after_id = rows[-1][0]
+            signatures = pool.map(signature_from_file, [row[1] for row in rows], chunksize=chunksize)
+            batch = [(signature,) + tuple(row[1:]) for signature, row in zip(signatures, rows)]
+            index.add_many(batch)
+            done += len(batch)
+            found += sum(1 for row in batch if row[0] is not None)
+            if progress is not None:
+                progress(done, total)
+    logging.info(f"Face signature backfill processed {done} images, {found} with a detectable face.")
+    return done, found
+
+
+def main(argv=None):
+    import argparse
+    from database import Database
+    parser = argparse.ArgumentParser(description="Backfill face signatures for past visits.")
+    parser.add_argument("database", help="path to badge_inventory.db")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    db = Database(args.database)
+    try:
+        processed, found = backfill_signatures(
+            FaceSignatureIndex(db), args.workers, args.batch_size,
+            lambda done, total: print(f"\r{done}/{total}", end="", file=sys.stderr))
+    finally:
+        db.close()
+    print(f"\n{processed} images processed, {found} signatures stored.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import Database
+from history_query import HISTORY_COLUMNS, month_range
+
+ARCHIVE_BATCH_SIZE = 5000
+_ARCHIVE_FILE = re.compile(r"^history_(\d{4}-\d{2})\.db$")
+
+
+class HistoryArchive:
+    """Closed visits moved out of the live database, one SQLite file per month.
+
+    Each history_YYYY-MM.db holds a visitor_history table with the live
+    table's columns and original ids, so rows from the live database and
+    the archives merge on (time_in, id) without collisions.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._databases = {}
+        self._lock = threading.Lock()
+
+    def path(self, month):
+        return os.path.join(self.directory, f"history_{month}.db")
+
+    def months(self):
+        """Archived months, newest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((m.group(1) for m in map(_ARCHIVE_FILE.match, names) if m), reverse=True)
+
+    def database(self, month, create=False):
+        with self._lock:
+            db = self._databases.get(month)
+            if db is None:
+                if not create and not os.path.exists(self.path(month)):
+                    return None
+                os.makedirs(self.directory, exist_ok=True)
+                # Archives are written once and then only read; a rollback
+                # journal keeps each month a single self-contained file.
+                db = self._databases[month] = Database(self.path(month), journal_mode="DELETE")
+        if create:
+            with db.transaction() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS visitor_history (
+                        id INTEGER PRIMARY KEY, name TEXT, company TEXT, badge_id TEXT,
+                        reason_of_visit TEXT, area TEXT, time_in TEXT, time_out TEXT,
+                        face_file TEXT, driver_license_file TEXT
+                    )
+                ''')
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_history_time_in ON visitor_history (time_in, id)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_history_name ON visitor_history (name COLLATE NOCASE)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_history_company ON visitor_history (company COLLATE NOCASE)")
+        return db
+
+    def databases(self, newest_first=True):
+        """(month, Database) for every archived month."""
+        months = self.months() if newest_first else list(reversed(self.months()))
+        return [(month, db) for month in months for db in [self.database(month)] if db is not None]
+
+    def close(self):
+        with self._lock:
+            for db in self._databases.values():
+                db.close()
+            self._databases.clear()
+
+
+def archive_history(db, archive, older_than_days, progress=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move closed visits from months older than older_than_days into the archive.
+
+    Only whole months move. Rows are copied to the month's file and then
+    deleted from the live database a batch at a time, so writers are never
+    locked out for long; a run interrupted between the two steps is
+    completed by the next one. The live database is vacuumed afterwards.
+    progress(done, total) is called after every batch. Returns the number
+    of visits archived.
+    """
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime("%Y-%m-01")
+    closed = "time_out IS NOT NULL AND time_out != ''"
+    total = db.query(f"SELECT COUNT(*) FROM visitor_history WHERE time_in < ? AND {closed}", (cutoff,))[0][0]
+    if not total:
+        return 0
+    months = [row[0] for row in db.query(
+        f"SELECT DISTINCT substr(time_in, 1, 7) FROM visitor_history WHERE time_in < ? AND {closed} ORDER BY 1",
+        (cutoff,))]
+
+    start_time = time.perf_counter()
+    columns = ", ".join(HISTORY_COLUMNS)
+    moved = 0
+    for month in months:
+        try:
+            start, end = month_range(month)
+        except ValueError:
+            logging.warning(f"Skipping visits with an unreadable check-in month {month!r}.")
+            continue
+        target = archive.database(month, create=True)
+        while True:
+            rows = db.query(
+                f"SELECT {columns} FROM visitor_history WHERE time_in >= ? AND time_in < ? AND {closed} "
+                f"ORDER BY id LIMIT ?", (start, end, batch_size))
+            if not rows:
+                break
+            with target.transaction() as conn:
+                conn.executemany(f"INSERT OR IGNORE INTO visitor_history ({columns}) "
+                                 f"VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})", rows)
+            with db.transaction() as conn:
+                conn.executemany("DELETE FROM visitor_history WHERE id = ?", [(row[0],) for row in rows])
+            moved += len(rows)
+            if progress is not None:
+                progress(moved, total)
+        target.execute("ANALYZE")
+    logging.info(f"Archived {moved} visits from {len(months)} months in "
+                 f"{time.perf_counter() - start_time:.1f} s.")
+    compact_live_database(db)
+    return moved
+
+
+def compact_live_database(db):
+    conn = db.connection()
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'visitor_history_fts'").fetchone():
+            with conn:
+                conn.execute("INSERT INTO visitor_history_fts (visitor_history_fts) VALUES ('optimize')")
+        start = time.perf_counter()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logging.info(f"Vacuumed the live database in {time.perf_counter() - start:.1f} s.")
+    except sqlite3.OperationalError as e:
+        # Usually another connection is busy; the space is reclaimed next time
+        logging.warning(f"Could not compact the live database: {e}")
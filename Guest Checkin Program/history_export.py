@@ -0,0 +1,43 @@
+import csv
+import gzip
+
+from history_query import HISTORY_COLUMNS, history_filters
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_history(db, filepath, start_date=None, end_date=None, company=None, area=None,
+                   compress=False, progress=None, batch_size=EXPORT_BATCH_SIZE, archive=None):
+    """Stream matching visitor_history rows to a CSV (optionally gzip) file.
+
+    Rows are read batch_size at a time so memory stays flat regardless of
+    table size. With an archive, archived months are written first, oldest
+    first, followed by the live table. progress(done, total) is called
+    after every batch. Returns the number of rows written.
+    """
+    sources = [(month_db, False) for _, month_db in archive.databases(newest_first=False)] if archive else []
+    sources.append((db, True))
+    queries = []
+    for source, use_fts in sources:
+        where, params = history_filters(start_date, end_date, company_contains=company, area=area,
+                                        use_fts=use_fts)
+        queries.append((source.connection(), where, params))
+    total = sum(conn.execute(f"SELECT COUNT(*) FROM visitor_history{where}", params).fetchone()[0]
+                for conn, where, params in queries)
+
+    opener = gzip.open if compress else open
+    written = 0
+    with opener(filepath, 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HISTORY_COLUMNS)
+        for conn, where, params in queries:
+            cursor = conn.execute(f"SELECT {', '.join(HISTORY_COLUMNS)} FROM visitor_history{where} ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                written += len(rows)
+                if progress is not None:
+                    progress(written, total)
+    return written
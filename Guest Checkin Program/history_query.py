@@ -0,0 +1,150 @@
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+
+PAGE_SIZE = 100
+HISTORY_COLUMNS = ("id", "name", "company", "badge_id", "reason_of_visit", "area",
+                   "time_in", "time_out", "face_file", "driver_license_file")
+FTS_COLUMNS = ("name", "company", "badge_id", "reason_of_visit", "area")
+
+_fts_available = None
+
+
+def init_history_search(db):
+    """Create the visitor_history indexes and, when SQLite has FTS5, the full-text table."""
+    global _fts_available
+    with db.transaction() as conn:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_time_in ON visitor_history (time_in, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_name ON visitor_history (name COLLATE NOCASE)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_company ON visitor_history (company COLLATE NOCASE)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_badge ON visitor_history (badge_id)")
+
+    try:
+        with db.transaction() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'visitor_history_fts'").fetchone()
+            if not exists:
+                cols = ", ".join(FTS_COLUMNS)
+                new_cols = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+                old_cols = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+                conn.execute(f"CREATE VIRTUAL TABLE visitor_history_fts USING fts5("
+                             f"{cols}, content='visitor_history', content_rowid='id')")
+                conn.execute(f"""
+                    CREATE TRIGGER visitor_history_fts_ai AFTER INSERT ON visitor_history BEGIN
+                        INSERT INTO visitor_history_fts (rowid, {cols}) VALUES (new.id, {new_cols});
+                    END""")
+                conn.execute(f"""
+                    CREATE TRIGGER visitor_history_fts_ad AFTER DELETE ON visitor_history BEGIN
+                        INSERT INTO visitor_history_fts (visitor_history_fts, rowid, {cols})
+                        VALUES ('delete', old.id, {old_cols});
+                    END""")
+                conn.execute(f"""
+                    CREATE TRIGGER visitor_history_fts_au AFTER UPDATE ON visitor_history BEGIN
+                        INSERT INTO visitor_history_fts (visitor_history_fts, rowid, {cols})
+                        VALUES ('delete', old.id, {old_cols});
+                        INSERT INTO visitor_history_fts (rowid, {cols}) VALUES (new.id, {new_cols});
+                    END""")
+                conn.execute("INSERT INTO visitor_history_fts (visitor_history_fts) VALUES ('rebuild')")
+        _fts_available = True
+    except sqlite3.OperationalError as e:
+        logging.warning(f"FTS5 unavailable, history text search falls back to LIKE: {e}")
+        _fts_available = False
+
+
+def _fts_query(text):
+    # Quote each word and match it as a prefix; all words must match
+    words = [w.replace('"', '""') for w in text.split()]
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def month_range(month):
+    """("YYYY-MM-01", first day of the next month) for a "YYYY-MM" month."""
+    start = datetime.strptime(month, "%Y-%m")
+    following = (start + timedelta(days=32)).replace(day=1)
+    return start.strftime("%Y-%m-%d"), following.strftime("%Y-%m-%d")
+
+
+def history_filters(start_date=None, end_date=None, name=None, company=None, area=None,
+                    badge_id=None, text=None, company_contains=None, use_fts=True):
+    """Build a WHERE clause and parameters for visitor_history.
+
+    Dates are inclusive YYYY-MM-DD strings on time_in. Name and company are
+    case-insensitive prefix matches (served by their NOCASE indexes), area
+    is a case-insensitive substring, badge_id is exact, and text searches all
+    descriptive columns. company_contains matches anywhere in the company
+    name, as the CSV export's company filter always has. Pass
+    use_fts=False for tables without the full-text index, such as monthly
+    archives.
+    """
+    clauses, params = [], []
+    if start_date:
+        clauses.append("time_in >= ?")
+        params.append(datetime.strptime(start_date, "%Y-%m-%d").strftime("%Y-%m-%d"))
+    if end_date:
+        clauses.append("time_in < ?")
+        params.append((datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d"))
+    if name:
+        clauses.append("name LIKE ?")
+        params.append(f"{name}%")
+    if company:
+        clauses.append("company LIKE ?")
+        params.append(f"{company}%")
+    if company_contains:
+        clauses.append("company LIKE ?")
+        params.append(f"%{company_contains}%")
+    if area:
+        clauses.append("area LIKE ?")
+        params.append(f"%{area}%")
+    if badge_id:
+        clauses.append("badge_id = ?")
+        params.append(badge_id)
+    if text and text.strip():
+        if use_fts and _fts_available:
+            clauses.append("id IN (SELECT rowid FROM visitor_history_fts WHERE visitor_history_fts MATCH ?)")
+            params.append(_fts_query(text))
+        else:
+            clauses.append("(" + " OR ".join(f"{c} LIKE ?" for c in FTS_COLUMNS) + ")")
+            params.extend([f"%{text.strip()}%"] * len(FTS_COLUMNS))
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
+
+
+def _query_page(db, after, limit, filters, use_fts):
+    where, params = history_filters(**filters, use_fts=use_fts)
+    if after is not None:
+        where += (" AND " if where else " WHERE ") + "(time_in, id) < (?, ?)"
+        params = params + list(after)
+    return db.query(
+        f"SELECT {', '.join(HISTORY_COLUMNS)} FROM visitor_history{where} "
+        f"ORDER BY time_in DESC, id DESC LIMIT ?", params + [limit])
+
+
+def query_history(db, after=None, limit=PAGE_SIZE, archive=None, **filters):
+    """Return (rows, next_key) for one page of history, newest first.
+
+    Pages use keyset pagination on (time_in, id): pass the returned
+    next_key as after to fetch the following page. next_key is None on the
+    last page. With an archive, archived months are merged in as well; only
+    months that can still contribute to the page are opened.
+    """
+    rows = _query_page(db, after, limit + 1, filters, True)
+    if archive is not None:
+        start_date = filters.get("start_date")
+        for month, month_db in archive.databases():
+            month_start, month_end = month_range(month)
+            if after is not None and after[0] < month_start:
+                # Everything in this month sorts before the page we are on
+                continue
+            if len(rows) > limit and rows[limit][6] >= month_end:
+                break
+            if start_date and month_end <= start_date:
+                break
+            rows += _query_page(month_db, after, limit + 1, filters, False)
+            # An interrupted archive run can leave a row in both places
+            unique = {row[0]: row for row in rows}
+            rows = sorted(unique.values(), key=lambda r: (r[6] or "", r[0]), reverse=True)[:limit + 1]
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, (last[6], last[0])
+    return rows, None
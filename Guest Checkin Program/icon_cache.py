@@ -0,0 +1,26 @@
+import logging
+import os
+import tkinter as tk
+
+
+def cached_icon(cache_dir, name, fill, height):
+    """Return a Font Awesome icon as a PhotoImage, rendering the SVG only once.
+
+    Rendered icons are written to cache_dir as PNGs, which Tk loads natively
+    on later launches without importing or running the SVG renderer.
+    """
+    path = os.path.join(cache_dir, f"{name}_{fill.lstrip('#')}_{height}.png")
+    if os.path.exists(path):
+        try:
+            return tk.PhotoImage(file=path)
+        except tk.TclError:
+            logging.warning(f"Discarding unreadable cached icon {path}.")
+
+    import tkfontawesome as fa
+    image = fa.icon_to_image(name, fill=fill, scale_to_height=height)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        image.write(path, format="png")
+    except (OSError, tk.TclError) as e:
+        logging.warning(f"Could not cache icon {name}: {e}")
+    return image
@@ -0,0 +1,130 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import metrics
+
+DEFAULT_IMAGE_CONFIG = {
+    "max_width": 1280,
+    "max_height": 960,
+    "crop_to_fit": False,
+    "format": "jpeg",
+    "quality": 85,
+    "png_compression": 3,
+    "thumbnail_size": 160,
+    "workers": 2,
+    "retention_days": 365,
+    "archive_dir": "",
+}
+
+# format -> (extension, OpenCV encode flag, config key holding its value)
+FORMATS = {
+    "png": (".png", "IMWRITE_PNG_COMPRESSION", "png_compression"),
+    "jpeg": (".jpg", "IMWRITE_JPEG_QUALITY", "quality"),
+    "webp": (".webp", "IMWRITE_WEBP_QUALITY", "quality"),
+}
+
+
+def load_image_config(path):
+    config = dict(DEFAULT_IMAGE_CONFIG)
+    try:
+        with open(path, 'r') as f:
+            config.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except json.JSONDecodeError:
+        logging.warning("Image config file is invalid. Using defaults.")
+    if config["format"] not in FORMATS:
+        logging.warning(f"Unsupported image format {config['format']!r}. Using jpeg.")
+        config["format"] = "jpeg"
+    return config
+
+
+class EncodeResult:
+    __slots__ = ("path", "thumbnail_path", "width", "height", "size", "thumbnail_size", "encode_ms")
+
+    def __init__(self, path, thumbnail_path, width, height, size, thumbnail_size, encode_ms):
+        self.path = path
+        self.thumbnail_path = thumbnail_path
+        self.width = width
+        self.height = height
+        self.size = size
+        self.thumbnail_size = thumbnail_size
+        self.encode_ms = encode_ms
+
+
+def fit_frame(frame, max_width, max_height, crop=False):
+    """Downscale a frame to fit max_width x max_height, center-cropping first if crop is set."""
+    import cv2
+    height, width = frame.shape[:2]
+    if crop:
+        target_ratio = max_width / max_height
+        if width / height > target_ratio:
+            new_width = int(height * target_ratio)
+            x = (width - new_width) // 2
+            frame = frame[:, x:x + new_width]
+        else:
+            new_height = int(width / target_ratio)
+            y = (height - new_height) // 2
+            frame = frame[y:y + new_height]
+        height, width = frame.shape[:2]
+    scale = min(max_width / width, max_height / height, 1.0)
+    if scale < 1.0:
+        frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    return frame
+
+
+class ImageEncoder:
+    """Encodes captured frames on a worker pool so capture returns immediately."""
+
+    def __init__(self, config):
+        self.config = config
+        self._executor = ThreadPoolExecutor(max_workers=config["workers"], thread_name_prefix="encode")
+        self._lock = threading.Lock()
+        self.stats = {"images": 0, "bytes": 0, "thumbnail_bytes": 0, "encode_ms": 0.0}
+
+    def submit(self, frame, store):
+        return self._executor.submit(self._encode, frame, store)
+
+    def _encode(self, frame, store):
+        import cv2
+        start = time.perf_counter()
+        config = self.config
+        ext, flag, key = FORMATS[config["format"]]
+        params = [getattr(cv2, flag), int(config[key])]
+
+        image = fit_frame(frame, config["max_width"], config["max_height"], config["crop_to_fit"])
+        ok, data = cv2.imencode(ext, image, params)
+        if not ok:
+            raise RuntimeError(f"Could not encode image as {config['format']}")
+        path = store.put(data.tobytes(), ext)
+
+        thumb_side = config["thumbnail_size"]
+        thumb = fit_frame(image, thumb_side, thumb_side)
+        ok, thumb_data = cv2.imencode(ext, thumb, params)
+        if ok:
+            thumb_data = thumb_data.tobytes()
+            thumbnail_path = store.put_thumbnail(path, thumb_data)
+        else:
+            # The full image is saved; viewers fall back to it without a thumbnail
+            logging.warning(f"Could not encode a thumbnail for {path}")
+            thumb_data, thumbnail_path = b"", None
+
+        encode_ms = (time.perf_counter() - start) * 1000
+        result = EncodeResult(path, thumbnail_path, image.shape[1], image.shape[0],
+                              len(data), len(thumb_data), encode_ms)
+        with self._lock:
+            self.stats["images"] += 1
+            self.stats["bytes"] += result.size
+            self.stats["thumbnail_bytes"] += result.thumbnail_size
+            self.stats["encode_ms"] += encode_ms
+        metrics.observe("image.encode", encode_ms)
+        metrics.increment("image.bytes_written", result.size + result.thumbnail_size)
+        logging.info(f"Encoded {path} ({result.width}x{result.height}, {result.size} bytes, "
+                     f"thumbnail {result.thumbnail_size} bytes) in {encode_ms:.1f} ms")
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+
+THUMBNAIL_DIR = "thumbs"
+PURGE_BATCH_SIZE = 500
+
+
+class ImageStore:
+    """Content-addressed image directory sharded by hash prefix.
+
+    Files live at <root>/<h[0:2]>/<h[2:4]>/<h>.<ext> where h is the SHA-256 of
+    the encoded bytes, so identical images are stored once and no two
+    captures can collide on a name. Thumbnails mirror the layout under
+    <root>/thumbs/.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _shard_path(self, base, digest, ext):
+        return os.path.join(base, digest[0:2], digest[2:4], digest + ext)
+
+    def _write(self, path, data):
+        if os.path.exists(path):
+            # Duplicate content: refresh the age so retention keeps it
+            os.utime(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Per thread as well as per process: encoder threads can store the
+        # same content at the same moment
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put(self, data, ext):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._shard_path(self.root, digest, ext)
+        self._write(path, data)
+        return path
+
+    def thumbnail_path(self, path):
+        rel = os.path.relpath(path, self.root)
+        return os.path.join(self.root, THUMBNAIL_DIR, rel)
+
+    def put_thumbnail(self, path, data):
+        thumbnail_path = self.thumbnail_path(path)
+        self._write(thumbnail_path, data)
+        return thumbnail_path
+
+    def iter_files_older_than(self, cutoff):
+        """Yield paths with an mtime before cutoff, walking the tree without listing it all at once."""
+        stack = [self.root]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False) and not entry.name.endswith(".tmp"):
+                            if entry.stat().st_mtime < cutoff:
+                                yield entry.path
+            except FileNotFoundError:
+                continue
+
+
+def find_thumbnail(stores, path):
+    """The pre-rendered thumbnail for an image in one of the stores, or None."""
+    for store in stores:
+        if os.path.commonpath([os.path.abspath(path), os.path.abspath(store.root)]) == os.path.abspath(store.root):
+            return store.thumbnail_path(path)
+    return None
+
+
+def purge_images(db, stores, retention_days, archive_dir=None, batch_size=PURGE_BATCH_SIZE, history_archive=None):
+    """Delete (or move under archive_dir) images older than retention_days.
+
+    visitor_history references to the affected files are rewritten to the
+    archived path, or cleared when the file is deleted, in the live database
+    and in every month of history_archive; face signatures of deleted faces
+    are removed. Returns the number of files purged.
+    """
+    databases = [db] + ([month_db for _, month_db in history_archive.databases()] if history_archive else [])
+    cutoff = time.time() - retention_days * 86400
+    purged = 0
+    batch = []
+    for store in stores:
+        for path in store.iter_files_older_than(cutoff):
+            new_path = None
+            try:
+                if archive_dir:
+                    rel = os.path.relpath(path, os.path.dirname(store.root))
+                    new_path = os.path.join(archive_dir, rel)
+                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                    shutil.move(path, new_path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                logging.error(f"Failed to purge image {path}: {e}")
+                continue
+            batch.append((path, new_path))
+            purged += 1
+            if len(batch) >= batch_size:
+                for target in databases:
+                    _update_image_references(target, batch)
+                batch = []
+        _remove_empty_dirs(store.root)
+    if batch:
+        for target in databases:
+            _update_image_references(target, batch)
+    logging.info(f"Image retention purged {purged} files older than {retention_days} days.")
+    return purged
+
+
+def _update_image_references(db, moves):
+    with db.transaction() as conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS purged_images (old_path TEXT PRIMARY KEY, new_path TEXT)")
+        conn.execute("DELETE FROM purged_images")
+        conn.executemany("INSERT OR REPLACE INTO purged_images VALUES (?, ?)", moves)
+        for column in ("face_file", "driver_license_file"):
+            conn.execute(f"""
+                UPDATE visitor_history
+                SET {column} = (SELECT new_path FROM purged_images WHERE old_path = visitor_history.{column})
+                WHERE {column} IN (SELECT old_path FROM purged_images)
+            """)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'face_signatures'").fetchone():
+            # Signatures follow archived faces and are dropped with deleted ones
+            conn.execute("DELETE FROM face_signatures WHERE face_file IN "
+                         "(SELECT old_path FROM purged_images WHERE new_path IS NULL)")
+            conn.execute("""
+                UPDATE face_signatures
+                SET face_file = (SELECT new_path FROM purged_images WHERE old_path = face_signatures.face_file)
+                WHERE face_file IN (SELECT old_path FROM purged_images)
+            """)
+
+
+def _remove_empty_dirs(root):
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if dirpath != root and not os.listdir(dirpath):
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import time
+import uuid
+
+from instrumentation import metrics
+
+
+class CheckinJournal:
+    """Append-only log of check-in/check-out events on top of a JSON snapshot.
+
+    The snapshot (checkin_records.json) keeps its original list-of-records
+    format. Each change is appended to the journal as one JSON line, fsynced
+    in batches, and folded back into the snapshot once enough events pile up.
+    Compaction snapshots snapshot_source(), so the owner runs compact_if_due()
+    only after its records reflect every appended event.
+    """
+
+    def __init__(self, snapshot_path, journal_path, snapshot_source,
+                 sync_every=16, sync_interval=2.0, compact_every=500):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.snapshot_source = snapshot_source
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compact_every = compact_every
+        self._file = None
+        self._pending = 0
+        self._events = 0
+        self._last_sync = time.monotonic()
+
+    def load(self):
+        """Return (records, needs_compaction) from the snapshot plus replayed journal."""
+        records = {}
+        assigned_ids = False
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r') as f:
+                    for record in json.load(f):
+                        if not record.get('id'):
+                            # Records from before ids; give each its own so none collapse
+                            record['id'] = str(uuid.uuid4())
+                            assigned_ids = True
+                        records[record['id']] = record
+            except Exception as e:
+                logging.error(f"Error loading check-in snapshot: {e}")
+
+        replayed, torn = 0, False
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Only the last line can be torn by a crash mid-append
+                        torn = True
+                        continue
+                    self._apply(records, event)
+                    replayed += 1
+        if torn:
+            logging.warning("Discarded a torn entry at the end of the check-in journal.")
+        self._events = replayed
+        return list(records.values()), replayed > 0 or torn or assigned_ids
+
+    @staticmethod
+    def _apply(records, event):
+        op = event.get("op")
+        if op == "in":
+            record = event["record"]
+            records[record.get('id')] = record
+        elif op == "out":
+            records.pop(event["id"], None)
+        elif op == "out_all":
+            records.clear()
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.journal_path, 'a', encoding='utf-8')
+        return self._file
+
+    def append(self, *events):
+        with metrics.timed("journal.append"):
+            self._append(events)
+
+    def _append(self, events):
+        f = self._open()
+        f.write("".join(json.dumps(e, separators=(',', ':')) + "\n" for e in events))
+        # Flushing hands the line to the OS so a process crash loses nothing;
+        # the fsync for power loss is batched.
+        f.flush()
+        self._pending += len(events)
+        self._events += len(events)
+        if self._pending >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def check_in(self, record):
+        self.append({"op": "in", "record": record})
+
+    def check_in_many(self, records):
+        # One write and at most one fsync for the whole group
+        self.append(*({"op": "in", "record": record} for record in records))
+
+    def check_out(self, record_id):
+        self.append({"op": "out", "id": record_id})
+
+    def check_out_all(self):
+        self.append({"op": "out_all"})
+
+    def sync(self):
+        if self._file is not None and self._pending:
+            try:
+                with metrics.timed("journal.fsync"):
+                    os.fsync(self._file.fileno())
+            except OSError as e:
+                logging.error(f"Error syncing check-in journal: {e}")
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def compact_if_due(self):
+        if self._events >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Write the current records as a new snapshot and truncate the journal."""
+        tmp_path = self.snapshot_path + ".tmp"
+        start = time.perf_counter()
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(list(self.snapshot_source()), f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            logging.error(f"Error compacting check-in journal: {e}")
+            return
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        with open(self.journal_path, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = 0
+        self._events = 0
+        self._last_sync = time.monotonic()
+        metrics.observe("journal.compact", (time.perf_counter() - start) * 1000)
+
+    def close(self):
+        self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,20 +1,35 @@
+import time
+STARTUP_STARTED = time.perf_counter()  # before the imports, so their cost is measured
+import sys
 import tkinter as tk
 import ttkbootstrap as ttk
 from tkinter import messagebox, filedialog
-import cv2
 import os
-from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+from datetime import datetime, timedelta
 import sqlite3
 import logging
 import json
 import uuid
 import csv
-import tkfontawesome as fa
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageTk
+from camera import CameraService
+from image_encoder import ImageEncoder, load_image_config
+from image_store import ImageStore, find_thumbnail, purge_images
+from face_signature import FaceSignatureIndex, backfill_signatures, compute_signature
+from history_export import export_history
+from history_archive import HistoryArchive, archive_history
+from history_query import init_history_search, query_history
+from rollups import occupancy, traffic_report
+from notifier import NotificationQueue, NotificationWorker
+from badge_pool import expand_badge_range
+from checkin_core import BadgeUnavailableError, CheckInCore, load_kiosk_config
+from database import Database
+from icon_cache import cached_icon
+from instrumentation import metrics, setup_logging
+from thumbnail_cache import ThumbnailCache, ThumbnailPane, neighbour_rows
+from tree_sync import TreeSync
+from visit_store import VisitRecord
 
 # --- Main Configuration ---
 MAIN_DIR = os.getcwd() # Use current working directory for portability
@@ -28,57 +43,129 @@ LOG_PATH = os.path.join(MAIN_DIR, "logs")
 if not os.path.exists(LOG_PATH):
     os.makedirs(LOG_PATH)
 CHECKIN_FILE = os.path.join(MAIN_DIR, "checkin_records.json")
+CHECKIN_JOURNAL_FILE = os.path.join(MAIN_DIR, "checkin_records.journal")
+KIOSK_CONFIG_FILE = os.path.join(MAIN_DIR, "kiosk_config.json")
+ICON_CACHE_DIR = os.path.join(MAIN_DIR, "cache", "icons")
+JOURNAL_SYNC_MS = 2000
+SHARED_REFRESH_MS = 1000
+SEARCH_DEBOUNCE_MS = 150
+PREVIEW_INTERVAL_MS = 33
+CAMERA_PREWARM_MS = 1000
+# Gap between the window mapping and the deferred startup work, so the
+# window manager's expose is handled and the first frame drawn first
+FIRST_PAINT_DELAY_MS = 50
+ENCODE_WAIT_SECONDS = 10
+BACKGROUND_POLL_MS = 100
+BACKGROUND_WORKERS = 2
+METRICS_REFRESH_MS = 1000
+DASHBOARD_REFRESH_MS = 5000
+DASHBOARD_DEFAULT_DAYS = 7
 BADGE_DB_PATH = os.path.join(MAIN_DIR, "badge_inventory.db")
+BADGE_CATEGORIES = ["Visitor", "Contractor", "Temporary"]
+ALL_CATEGORIES = "All"
 SMTP_CONFIG_FILE = os.path.join(MAIN_DIR, "smtp_config.json")
+IMAGE_CONFIG_FILE = os.path.join(MAIN_DIR, "image_config.json")
+HISTORY_ARCHIVE_PATH = os.path.join(MAIN_DIR, "archive", "history")
 
-def init_badge_db():
-    conn = sqlite3.connect(BADGE_DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS badges (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            badge_number TEXT NOT NULL UNIQUE,
-            category TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS visitor_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, company TEXT, badge_id TEXT,
-            reason_of_visit TEXT, area TEXT, time_in TEXT, time_out TEXT,
-            face_file TEXT, driver_license_file TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+LOG_FILENAME = os.path.join(LOG_PATH, "debug.log")
+METRICS_DUMP_FILE = os.path.join(LOG_PATH, "metrics.json")
+# Records are queued and written by a listener thread, rotating at 5 MB
+log_listener = setup_logging(LOG_FILENAME)
 
-init_badge_db()
+kiosk_config = load_kiosk_config(KIOSK_CONFIG_FILE)
+if kiosk_config["backend"] == "shared" and kiosk_config["shared_db_path"]:
+    db = Database(kiosk_config["shared_db_path"], journal_mode=kiosk_config["shared_journal_mode"])
+else:
+    db = Database(BADGE_DB_PATH)
 
-LOG_FILENAME = os.path.join(LOG_PATH, "debug.log")
-logging.basicConfig(
-    filename=LOG_FILENAME, level=logging.DEBUG,
-    format='%(asctime)s %(levelname)s: %(message)s',
-    datefmt='%m-%d-%Y %H-%M-%S'
-)
+startup_marks = []
+
+def mark_startup(label):
+    startup_marks.append((label, time.perf_counter()))
+
+def startup_report():
+    parts, previous = [], STARTUP_STARTED
+    for label, t in startup_marks:
+        parts.append(f"{label} {(t - previous) * 1000:.0f} ms")
+        previous = t
+    return f"Startup took {(previous - STARTUP_STARTED) * 1000:.0f} ms: " + ", ".join(parts)
 
 class GuestCheckInApp(ttk.Window):
     def __init__(self):
+        mark_startup("imports")
         super().__init__(themename="flatly")
+        mark_startup("window")
         
         self.title("Guest Check-In System")
         self.geometry("900x950")
         
         self.load_smtp_config()
 
-        self.records = []
+        self.core = CheckInCore(db, kiosk_config, CHECKIN_FILE, CHECKIN_JOURNAL_FILE)
+        self._search_job = None
+        self._badge_values = None
         self.face_file = None
+        self.face_signature = None
         self.driver_license_file = None
         self.visitor_policy_var = tk.IntVar()
+        self.camera = CameraService()
+        self.image_config = load_image_config(IMAGE_CONFIG_FILE)
+        self.image_encoder = ImageEncoder(self.image_config)
+        self.face_store = ImageStore(FACE_PATH)
+        self.license_store = ImageStore(DRIVER_LICENSE_PATH)
+        self.history_archive = HistoryArchive(kiosk_config["history_archive_dir"] or HISTORY_ARCHIVE_PATH)
+        self.thumbnails = ThumbnailCache(
+            self, resolve=lambda path: find_thumbnail((self.face_store, self.license_store), path))
+        # Long-lived workers so each reuses its pooled database connection
+        self.background = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="background")
+        self.notifier = None
+        self.face_index = None
+        self.capture_window = None
         
-        self.load_records()
         self.create_widgets()
+        mark_startup("widgets")
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        # Everything else runs once the window is on screen
+        self._map_binding = self.bind("<Map>", self.on_first_map, add="+")
+
+    def on_first_map(self, event):
+        # Children map too and share the toplevel's bindings
+        if event.widget is not self:
+            return
+        self.unbind("<Map>", self._map_binding)
+        self.after(FIRST_PAINT_DELAY_MS, self.finish_startup)
+
+    def finish_startup(self):
+        # Draw anything still pending before the slow work blocks the loop
+        self.update_idletasks()
+        mark_startup("first paint")
+        db.init_schema()
+        mark_startup("database")
+        self.load_records()
         self.update_treeview()
+        mark_startup("active visits")
         self.update_available_badges()
+        mark_startup("badges")
+        self.notifier = NotificationWorker(
+            NotificationQueue(db),
+            lambda: (self.smtp_server, self.smtp_port, self.sender_email, self.sender_password))
+        self.notifier.start()
+        mark_startup("notifier")
+        self.face_index = FaceSignatureIndex(db)
+        mark_startup("face index")
+        # Index and FTS creation can take a while on a large history table
+        self.background.submit(init_history_search, db)
+
+        self.after(JOURNAL_SYNC_MS, self.sync_journal)
+        self.after(SHARED_REFRESH_MS, self.refresh_from_shared_store)
+        if kiosk_config["prewarm_camera"]:
+            self.after(CAMERA_PREWARM_MS, self.camera.start)
+
+        report = startup_report()
+        logging.info(report)
+        if "--startup-report" in sys.argv:
+            print(report)
 
     def load_smtp_config(self):
         try:
@@ -95,33 +182,50 @@ class GuestCheckInApp(ttk.Window):
             self.sender_password = ""
             logging.warning("SMTP config file not found or invalid. Using defaults.")
     
-    def save_records(self):
+    def load_records(self):
         try:
-            with open(CHECKIN_FILE, 'w') as f:
-                json.dump(self.records, f, indent=4)
+            self.core.load()
         except Exception as e:
-            logging.error(f"Error saving records: {e}")
+            logging.error(f"Error loading records: {e}")
 
-    def load_records(self):
-        if not os.path.exists(CHECKIN_FILE): return
+    def sync_journal(self):
+        self.core.sync()
+        self.after(JOURNAL_SYNC_MS, self.sync_journal)
+
+    def refresh_from_shared_store(self):
+        # Picks up check-ins and check-outs made by other stations
         try:
-            with open(CHECKIN_FILE, 'r') as f:
-                records = json.load(f)
-                for record in records:
-                    if 'id' not in record:
-                        record['id'] = str(uuid.uuid4())
-                self.records = records
-                self.save_records()
+            if self.core.refresh():
+                self.perform_search()
+                self.update_available_badges()
         except Exception as e:
-            logging.error(f"Error loading records: {e}")
+            logging.error(f"Error refreshing active visits: {e}")
+        self.after(SHARED_REFRESH_MS, self.refresh_from_shared_store)
+
+    def on_close(self):
+        self.camera.stop()
+        self.thumbnails.close()
+        if self.notifier is not None:
+            self.notifier.stop()
+        self.image_encoder.shutdown()
+        self.background.shutdown(wait=False, cancel_futures=True)
+        self.core.close()
+        self.history_archive.close()
+        db.close()
+        try:
+            metrics.dump(METRICS_DUMP_FILE)
+        except OSError as e:
+            logging.error(f"Could not write metrics dump: {e}")
+        log_listener.stop()
+        self.destroy()
 
     def create_widgets(self):
-        self.icon_camera = fa.icon_to_image("camera", fill="#333", scale_to_height=16)
-        self.icon_id_card = fa.icon_to_image("id-card", fill="#333", scale_to_height=16)
-        self.icon_signin = fa.icon_to_image("sign-in-alt", fill="white", scale_to_height=16)
-        self.icon_signout = fa.icon_to_image("sign-out-alt", fill="white", scale_to_height=16)
-        self.icon_search = fa.icon_to_image("search", fill="#555", scale_to_height=12)
-        self.icon_admin = fa.icon_to_image("user-cog", fill="#337ab7", scale_to_height=16)
+        self.icon_camera = cached_icon(ICON_CACHE_DIR, "camera", "#333", 16)
+        self.icon_id_card = cached_icon(ICON_CACHE_DIR, "id-card", "#333", 16)
+        self.icon_signin = cached_icon(ICON_CACHE_DIR, "sign-in-alt", "white", 16)
+        self.icon_signout = cached_icon(ICON_CACHE_DIR, "sign-out-alt", "white", 16)
+        self.icon_search = cached_icon(ICON_CACHE_DIR, "search", "#555", 12)
+        self.icon_admin = cached_icon(ICON_CACHE_DIR, "user-cog", "#337ab7", 16)
 
         main_frame = ttk.Frame(self, padding=20)
         main_frame.pack(fill="both", expand=True)
@@ -144,8 +248,15 @@ class GuestCheckInApp(ttk.Window):
 
         # MODIFIED: Label text changed to indicate badge is optional
         ttk.Label(input_frame, text="Badge ID (Optional):").grid(row=2, column=0, padx=5, pady=10, sticky="e")
-        self.badge_combo = ttk.Combobox(input_frame, state="readonly")
-        self.badge_combo.grid(row=2, column=1, padx=5, pady=10, sticky="ew")
+        badge_frame = ttk.Frame(input_frame)
+        badge_frame.grid(row=2, column=1, padx=5, pady=10, sticky="ew")
+        self.badge_category_combo = ttk.Combobox(badge_frame, values=[ALL_CATEGORIES] + BADGE_CATEGORIES,
+                                                 state="readonly", width=12)
+        self.badge_category_combo.set(ALL_CATEGORIES)
+        self.badge_category_combo.pack(side="left", padx=(0, 10))
+        self.badge_category_combo.bind("<<ComboboxSelected>>", self.on_badge_category_selected)
+        self.badge_combo = ttk.Combobox(badge_frame, state="readonly")
+        self.badge_combo.pack(side="left", fill="x", expand=True)
 
         ttk.Label(input_frame, text="Reason of Visit:").grid(row=3, column=0, padx=5, pady=10, sticky="e")
         self.entry_reason = ttk.Entry(input_frame)
@@ -154,6 +265,13 @@ class GuestCheckInApp(ttk.Window):
         ttk.Label(input_frame, text="Area:").grid(row=4, column=0, padx=5, pady=10, sticky="e")
         self.entry_area = ttk.Entry(input_frame)
         self.entry_area.grid(row=4, column=1, padx=5, pady=10, sticky="ew")
+
+        ttk.Label(input_frame, text="Host Email (Optional):").grid(row=5, column=0, padx=5, pady=10, sticky="e")
+        self.entry_host_email = ttk.Entry(input_frame)
+        self.entry_host_email.grid(row=5, column=1, padx=5, pady=10, sticky="ew")
+
+        self.returning_label = ttk.Label(input_frame, text="", bootstyle="info")
+        self.returning_label.grid(row=6, column=0, columnspan=2, padx=5, sticky="w")
         
         self.visitor_policy_check = ttk.Checkbutton(
             main_frame, text="Sushic Kitchen Visitor Policy Signed?",
@@ -180,13 +298,20 @@ class GuestCheckInApp(ttk.Window):
         ttk.Label(search_frame, text=" Search:", image=self.icon_search, compound="left").pack(side="left", padx=(0, 10))
         self.search_entry = ttk.Entry(search_frame)
         self.search_entry.pack(side="left", fill="x", expand=True)
-        self.search_entry.bind("<KeyRelease>", self.perform_search)
+        self.search_entry.bind("<KeyRelease>", self.schedule_search)
         
+        tree_frame = ttk.Frame(display_frame)
+        tree_frame.pack(pady=10, fill="both", expand=True)
+        self.thumbnail_pane = ThumbnailPane(tree_frame, self.thumbnails)
+        self.thumbnail_pane.pack(side="right", fill="y", padx=(10, 0))
         cols = ("Name", "Company", "Time In", "Badge ID", "Area", "Reason of Visit")
-        self.tree = ttk.Treeview(display_frame, columns=cols, show="headings", bootstyle="primary")
+        self.tree = ttk.Treeview(tree_frame, columns=cols, show="headings", bootstyle="primary")
         for col in cols:
             self.tree.heading(col, text=col)
-        self.tree.pack(pady=10, fill="both", expand=True)
+            self.tree.column(col, width=110)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.tree.bind("<<TreeviewSelect>>", self.show_selected_thumbnails)
+        self.tree_sync = TreeSync(self.tree)
 
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(pady=10, fill="x", side="bottom")
@@ -196,58 +321,171 @@ class GuestCheckInApp(ttk.Window):
         self.admin_button = ttk.Button(button_frame, text=" Admin", image=self.icon_admin, compound="left", command=self.admin_action, bootstyle="info-outline")
         self.admin_button.pack(side="right")
         
+    def schedule_search(self, event=None):
+        # Debounce keystrokes so fast typing triggers a single search
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DEBOUNCE_MS, self.perform_search)
+
     def perform_search(self, event=None):
-        search_term = self.search_entry.get().lower()
-        if not search_term:
-            filtered_records = self.records
-        else:
-            filtered_records = [r for r in self.records if search_term in r['name'].lower() or search_term in r.get('company', '').lower()]
-        self.update_treeview(records_to_display=filtered_records)
+        self._search_job = None
+        self.update_treeview(records_to_display=self.core.search(self.search_entry.get().strip()))
 
     def update_treeview(self, records_to_display=None):
-        self.tree.delete(*self.tree.get_children())
-        records = records_to_display if records_to_display is not None else self.records
-        for record in records:
-            values = (record["name"], record.get("company", ""), record["time_in"], record["badge_id"], record.get("area", ""), record["reason_of_visit"])
-            self.tree.insert("", "end", iid=record["id"], values=values)
+        records = records_to_display if records_to_display is not None else self.core.visits
+        self.tree_sync.sync(
+            (record.id, (record.name, record.company, record.time_in, record.badge_id, record.area, record.reason_of_visit))
+            for record in records)
             
+    def show_selected_thumbnails(self, event=None):
+        selection = self.tree.selection()
+        record = self.core.visits.get(selection[0]) if selection else None
+        if record is None:
+            self.thumbnail_pane.clear()
+            return
+        self.thumbnail_pane.show(record.face_file, record.driver_license_file)
+        neighbours = (self.core.visits.get(iid) for iid in neighbour_rows(self.tree, selection[0]))
+        self.thumbnails.prefetch(path for r in neighbours if r for path in (r.face_file, r.driver_license_file))
+
     def update_available_badges(self):
-        conn = sqlite3.connect(BADGE_DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT badge_number FROM badges ORDER BY category, badge_number")
-        all_badges = [row[0] for row in c.fetchall()]
-        conn.close()
-        used_badges = [record["badge_id"] for record in self.records if record["badge_id"]]
-        self.badge_combo['values'] = [b for b in all_badges if b not in used_badges]
-
-    def capture_image(self, window_title, save_dir, file_prefix):
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
-            messagebox.showerror("Error", "Could not open webcam.")
-            return None
-        messagebox.showinfo("Instructions", "Press 'c' to capture, 'q' to quit.")
-        filename = None
-        while True:
-            ret, frame = cap.read()
-            if not ret: break
-            cv2.imshow(window_title, frame)
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord('c'):
-                ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = os.path.join(save_dir, f"{file_prefix}_{ts}.png")
-                cv2.imwrite(filename, frame)
-                messagebox.showinfo("Success", "Image saved.")
-                break
-            elif key == ord('q'): break
-        cap.release()
-        cv2.destroyAllWindows()
-        return filename
+        category = self.badge_category_combo.get()
+        values = self.core.available_badges(None if category == ALL_CATEGORIES else category)
+        # The free list hands back the same list until a badge is taken or released
+        if values is not self._badge_values:
+            self._badge_values = values
+            self.badge_combo['values'] = values
+        selected = self.badge_combo.get()
+        if selected and not self.core.badge_available(selected):
+            self.badge_combo.set("")
+
+    def on_badge_category_selected(self, event=None):
+        self.badge_combo.set("")
+        category = self.badge_category_combo.get()
+        self.update_available_badges()
+        if category != ALL_CATEGORIES:
+            self.badge_combo.set(self.core.next_badge(category) or "")
+
+    def capture_image(self, window_title, store, on_saved):
+        if self.capture_window is not None and self.capture_window.winfo_exists():
+            self.capture_window.lift()
+            return
+        self.camera.start()
+        self.camera.preview_active = True
+
+        window = ttk.Toplevel(self)
+        window.title(window_title)
+        window.transient(self)
+        self.capture_window = window
+
+        status_label = ttk.Label(window, text="Starting camera...", font=("Helvetica", 12))
+        status_label.pack(padx=10, pady=10)
+        preview_label = ttk.Label(window)
+        preview_label.pack(padx=10)
+        button_frame = ttk.Frame(window)
+        button_frame.pack(pady=10)
+
+        state = {"photo": None, "frame_id": 0, "job": None, "opened": time.perf_counter()}
+
+        def close():
+            if state["job"] is not None:
+                self.after_cancel(state["job"])
+            self.camera.preview_active = False
+            self.capture_window = None
+            window.destroy()
+
+        def refresh():
+            state["job"] = None
+            if self.camera.error:
+                close()
+                messagebox.showerror("Error", self.camera.error)
+                return
+            frame_id, preview = self.camera.latest_preview()
+            if preview is not None and frame_id != state["frame_id"]:
+                state["frame_id"] = frame_id
+                image = Image.fromarray(preview)
+                photo = state["photo"]
+                if photo is None or (photo.width(), photo.height()) != image.size:
+                    if photo is None:
+                        metrics.observe("camera.first_preview", (time.perf_counter() - state["opened"]) * 1000)
+                    state["photo"] = ImageTk.PhotoImage(image)
+                    preview_label.configure(image=state["photo"])
+                    status_label.configure(text="Press Capture (or 'c') to take the picture, Cancel (or 'q') to quit.")
+                else:
+                    photo.paste(image)
+            # Redraw at display rate; the grabber thread runs at the camera's rate
+            state["job"] = self.after(PREVIEW_INTERVAL_MS, refresh)
+
+        def capture():
+            frame = self.camera.grab()
+            if frame is None:
+                return
+            close()
+            # Encoding and writing happen on the encoder pool; check_in waits for the result
+            on_saved(self.image_encoder.submit(frame, store), frame)
+            messagebox.showinfo("Success", "Image captured.")
+
+        ttk.Button(button_frame, text="Capture", command=capture, bootstyle="success").pack(side="left", padx=10)
+        ttk.Button(button_frame, text="Cancel", command=close, bootstyle="secondary").pack(side="left", padx=10)
+        window.bind("c", lambda e: capture())
+        window.bind("q", lambda e: close())
+        window.protocol("WM_DELETE_WINDOW", close)
+        refresh()
 
     def capture_face(self):
-        self.face_file = self.capture_image("Face Capture", FACE_PATH, "face")
+        def on_saved(pending, frame):
+            self.face_file = pending
+            self.recognize_visitor(pending, frame)
+        self.capture_image("Face Capture", self.face_store, on_saved)
 
     def capture_driver_license(self):
-        self.driver_license_file = self.capture_image("Driver License", DRIVER_LICENSE_PATH, "license")
+        def on_saved(pending, frame):
+            self.driver_license_file = pending
+        self.capture_image("Driver License", self.license_store, on_saved)
+
+    def recognize_visitor(self, capture, frame):
+        """Look up the face in the background; the result only applies while capture is still current."""
+        self.face_signature = None
+        self.returning_label.configure(text="")
+        if self.face_index is None:
+            return
+
+        def work():
+            signature = compute_signature(frame)
+            return signature, (self.face_index.lookup(signature) if signature is not None else [])
+
+        def on_done(result):
+            # The guest was checked in, or the face retaken, while this ran
+            if self.face_file is not capture:
+                return
+            self.face_signature, matches = result
+            if matches:
+                self.prefill_returning_visitor(matches[0])
+
+        def on_error(e):
+            logging.warning(f"Returning-visitor lookup failed: {e}")
+
+        self.run_in_background(work, on_done, on_error)
+
+    def prefill_returning_visitor(self, match):
+        # Only fill what staff have not typed yet
+        for entry, value in ((self.entry_name, match["name"]), (self.entry_company, match["company"]),
+                             (self.entry_area, match["area"]), (self.entry_reason, match["reason_of_visit"])):
+            if value and not entry.get().strip():
+                entry.insert(0, value)
+        last_visit = match["seen_at"][:10]
+        self.returning_label.configure(
+            text=f"Welcome back, {match['name']}" + (f" (last visit {last_visit})" if last_visit else "") +
+                 ". Please check the details above.")
+
+    def resolve_capture(self, pending, label):
+        try:
+            # Time check-in spends blocked on an encode that has not finished yet
+            with metrics.timed("capture.wait"):
+                return pending.result(timeout=ENCODE_WAIT_SECONDS).path
+        except Exception as e:
+            logging.error(f"Failed to save {label} image: {e}")
+            messagebox.showerror("Capture Error", f"The {label} image could not be saved. Please capture it again.")
+            return None
 
     def check_in(self):
         name = self.entry_name.get().strip()
@@ -261,19 +499,45 @@ class GuestCheckInApp(ttk.Window):
         if not self.face_file or not self.driver_license_file:
             messagebox.showwarning("Capture Error", "Face and License must be captured.")
             return
+        face_file = self.resolve_capture(self.face_file, "face")
+        if face_file is None:
+            self.face_file = None
+            return
+        driver_license_file = self.resolve_capture(self.driver_license_file, "license")
+        if driver_license_file is None:
+            self.driver_license_file = None
+            return
 
-        record = {
-            "id": str(uuid.uuid4()),
-            "name": name,
-            "company": self.entry_company.get().strip(),
-            "badge_id": badge_id,
-            "reason_of_visit": reason,
-            "area": self.entry_area.get().strip(),
-            "time_in": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "face_file": self.face_file,
-            "driver_license_file": self.driver_license_file
-        }
-        self.records.append(record)
+        record = VisitRecord(
+            id=str(uuid.uuid4()),
+            name=name,
+            company=self.entry_company.get().strip(),
+            badge_id=badge_id,
+            reason_of_visit=reason,
+            area=self.entry_area.get().strip(),
+            time_in=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            face_file=face_file,
+            driver_license_file=driver_license_file
+        )
+        try:
+            self.core.check_in(record)
+        except BadgeUnavailableError:
+            messagebox.showwarning("Badge Unavailable", f"Badge {badge_id} was just issued at another station. Please pick another badge.")
+            self.badge_combo.set("")
+            self.update_available_badges()
+            return
+        except Exception as e:
+            logging.error(f"Failed to check in guest: {e}")
+            messagebox.showerror("Database Error", f"Guest was not checked in: {e}")
+            return
+        if self.face_signature is not None:
+            try:
+                self.face_index.add(self.face_signature, record)
+            except Exception as e:
+                logging.error(f"Failed to store face signature: {e}")
+        host_email = self.entry_host_email.get().strip()
+        if host_email:
+            self.notify_host(host_email, record)
         messagebox.showinfo("Success", f"Guest {name} checked in.")
         
         # Clear fields after check-in
@@ -282,46 +546,51 @@ class GuestCheckInApp(ttk.Window):
         self.badge_combo.set("")
         self.entry_reason.delete(0, "end")
         self.entry_area.delete(0, "end")
+        self.entry_host_email.delete(0, "end")
+        self.returning_label.configure(text="")
         self.face_file, self.driver_license_file = None, None
+        self.face_signature = None
         
-        self.save_records()
         self.update_treeview()
         self.update_available_badges()
 
+    def notify_host(self, host_email, record):
+        subject = f"Your visitor {record.name} has arrived"
+        body = (f"{record.name}" + (f" from {record.company}" if record.company else "") +
+                f" checked in at {record.time_in}.\n\n"
+                f"Reason of visit: {record.reason_of_visit}\n"
+                f"Area: {record.area or '-'}\n"
+                f"Badge: {record.badge_id or '-'}\n")
+        try:
+            # Queued only; the notifier thread does the SMTP work
+            self.notifier.notify(host_email, subject, body, record.face_file)
+        except Exception as e:
+            logging.error(f"Failed to queue host notification: {e}")
+
     def check_out(self):
         if not self.tree.selection():
             messagebox.showwarning("Selection Error", "Please select a guest to check out.")
             return
         
         record_id = self.tree.selection()[0]
-        record_to_checkout = next((r for r in self.records if r["id"] == record_id), None)
-        
-        if record_to_checkout:
-            time_out = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self.log_to_history(record_to_checkout, time_out)
-            self.records.remove(record_to_checkout)
-            messagebox.showinfo("Success", f"Guest {record_to_checkout['name']} checked out.")
-            self.save_records()
-            self.update_treeview()
-            self.update_available_badges()
-
-    def log_to_history(self, record, time_out):
+        time_out = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         try:
-            conn = sqlite3.connect(BADGE_DB_PATH)
-            c = conn.cursor()
-            c.execute("""
-                INSERT INTO visitor_history (name, company, badge_id, reason_of_visit, area, time_in, time_out, face_file, driver_license_file)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (record['name'], record.get('company'), record['badge_id'], record['reason_of_visit'], record.get('area'), record['time_in'], time_out, record['face_file'], record['driver_license_file']))
-            conn.commit()
-            conn.close()
+            record_to_checkout = self.core.check_out(record_id, time_out)
         except Exception as e:
             logging.error(f"Failed to log to history: {e}")
+            messagebox.showerror("Database Error", f"Guest was not checked out: {e}")
+            return
+        
+        if record_to_checkout:
+            messagebox.showinfo("Success", f"Guest {record_to_checkout.name} checked out.")
+        else:
+            messagebox.showinfo("Info", "This guest was already checked out at another station.")
+        self.update_treeview()
+        self.update_available_badges()
 
     def admin_action(self):
         admin_window = ttk.Toplevel(self)
         admin_window.title("Admin Menu")
-        admin_window.geometry("350x300")
         admin_window.transient(self)
         
         ttk.Label(admin_window, text="Admin Menu", font=("Helvetica", 16, "bold")).pack(pady=20)
@@ -329,48 +598,520 @@ class GuestCheckInApp(ttk.Window):
         button_configs = [
             ("Badge Inventory", self.badge_inventory_window, "secondary"),
             ("SMTP Settings", self.open_smtp_settings, "secondary"),
+            ("Visitor History", self.history_browser_window, "primary"),
+            ("Traffic Dashboard", self.traffic_dashboard_window, "primary"),
             ("Export Visitor History (CSV)", self.export_history_to_csv, "primary"),
+            ("Purge Old Images", self.purge_old_images, "warning"),
+            ("Archive Old History", self.archive_old_history, "warning"),
+            ("Backfill Face Signatures", self.backfill_face_signatures, "secondary"),
+            ("Import Pre-Registered Guests (CSV)", self.import_preregistered_guests, "primary"),
+            ("Performance", self.performance_window, "secondary"),
             ("Check Out All Guests", self.checkout_all_guests, "danger")
         ]
+        admin_window.geometry(f"350x{100 + 52 * len(button_configs)}")
         for text, command, style in button_configs:
             ttk.Button(admin_window, text=text, command=command, bootstyle=style).pack(pady=8, padx=20, fill="x")
 
+    def traffic_dashboard_window(self):
+        dashboard = ttk.Toplevel(self)
+        dashboard.title("Traffic Dashboard")
+        dashboard.geometry("900x620")
+        dashboard.transient(self)
+
+        frame = ttk.Frame(dashboard, padding=15)
+        frame.pack(fill="both", expand=True)
+
+        occupancy_frame = ttk.Labelframe(frame, text="On Site Now", padding=10)
+        occupancy_frame.pack(side="left", fill="y", padx=(0, 10))
+        total_label = ttk.Label(occupancy_frame, text="", font=("Helvetica", 14, "bold"))
+        total_label.pack(anchor="w", pady=(0, 10))
+        occupancy_tree = ttk.Treeview(occupancy_frame, columns=("Area", "Guests"), show="headings", bootstyle="primary", height=20)
+        occupancy_tree.heading("Area", text="Area")
+        occupancy_tree.heading("Guests", text="Guests")
+        occupancy_tree.column("Area", width=150)
+        occupancy_tree.column("Guests", width=70, anchor="e")
+        occupancy_tree.pack(fill="y", expand=True)
+        occupancy_sync = TreeSync(occupancy_tree)
+
+        traffic_frame = ttk.Labelframe(frame, text="Traffic", padding=10)
+        traffic_frame.pack(side="left", fill="both", expand=True)
+        controls = ttk.Frame(traffic_frame)
+        controls.pack(fill="x")
+        today = datetime.now().date()
+        start_entry, end_entry = ttk.Entry(controls, width=12), ttk.Entry(controls, width=12)
+        start_entry.insert(0, (today - timedelta(days=DASHBOARD_DEFAULT_DAYS - 1)).isoformat())
+        end_entry.insert(0, today.isoformat())
+        period_combo = ttk.Combobox(controls, values=["Day", "Hour"], state="readonly", width=6)
+        period_combo.set("Day")
+        by_combo = ttk.Combobox(controls, values=["Area", "Company", "Total"], state="readonly", width=9)
+        by_combo.set("Area")
+        for label, widget in (("From:", start_entry), ("To:", end_entry), ("By:", period_combo), ("and", by_combo)):
+            ttk.Label(controls, text=label).pack(side="left", padx=(0, 5))
+            widget.pack(side="left", padx=(0, 10))
+
+        cols = ("Period", "Group", "Check-ins", "Check-outs", "Avg Visit (min)")
+        traffic_tree = ttk.Treeview(traffic_frame, columns=cols, show="headings", bootstyle="primary")
+        for col in cols:
+            traffic_tree.heading(col, text=col)
+            traffic_tree.column(col, width=110, anchor="w" if col in ("Period", "Group") else "e")
+        traffic_tree.pack(fill="both", expand=True, pady=10)
+        traffic_sync = TreeSync(traffic_tree)
+        summary_label = ttk.Label(traffic_frame, text="")
+        summary_label.pack(anchor="w")
+
+        def refresh_traffic():
+            try:
+                start = datetime.strptime(start_entry.get().strip(), "%Y-%m-%d").date().isoformat()
+                end = datetime.strptime(end_entry.get().strip(), "%Y-%m-%d").date().isoformat()
+            except ValueError:
+                messagebox.showwarning("Input Error", "Dates must be YYYY-MM-DD.", parent=dashboard)
+                return
+            by = {"Area": "area", "Company": "company", "Total": None}[by_combo.get()]
+            try:
+                rows = traffic_report(db, start, end, period_combo.get().lower(), by)
+            except Exception as e:
+                logging.error(f"Traffic report failed: {e}")
+                messagebox.showerror("Report Error", f"An error occurred: {e}", parent=dashboard)
+                return
+            traffic_sync.sync((f"{p}|{g}", (p, g or "-", ins, outs, f"{avg:.1f}")) for p, g, ins, outs, avg in rows)
+            summary_label.configure(text=f"{sum(r[2] for r in rows)} check-ins and {sum(r[3] for r in rows)} check-outs "
+                                         f"from {start} to {end}.")
+
+        def refresh_occupancy():
+            if not dashboard.winfo_exists():
+                return
+            try:
+                rows = occupancy(db)
+            except Exception as e:
+                logging.error(f"Occupancy query failed: {e}")
+                rows = []
+            occupancy_sync.sync((area or "-", (area or "-", present)) for area, present in rows)
+            total_label.configure(text=f"{sum(present for _, present in rows)} guests on site")
+            dashboard.after(DASHBOARD_REFRESH_MS, refresh_occupancy)
+
+        for widget in (period_combo, by_combo):
+            widget.bind("<<ComboboxSelected>>", lambda e: refresh_traffic())
+        for widget in (start_entry, end_entry):
+            widget.bind("<Return>", lambda e: refresh_traffic())
+        ttk.Button(controls, text="Show", command=refresh_traffic, bootstyle="primary").pack(side="left")
+        refresh_occupancy()
+        refresh_traffic()
+
+    def performance_window(self):
+        perf_window = ttk.Toplevel(self)
+        perf_window.title("Performance")
+        perf_window.geometry("820x480")
+        perf_window.transient(self)
+
+        frame = ttk.Frame(perf_window, padding=15)
+        frame.pack(fill="both", expand=True)
+
+        cols = ("Metric", "Count", "Mean ms", "p50 ms", "p95 ms", "p99 ms", "Max ms")
+        perf_tree = ttk.Treeview(frame, columns=cols, show="headings", bootstyle="primary")
+        for col in cols:
+            perf_tree.heading(col, text=col)
+            perf_tree.column(col, width=100, anchor="e")
+        perf_tree.column("Metric", width=200, anchor="w")
+        perf_tree.pack(fill="both", expand=True)
+        perf_sync = TreeSync(perf_tree)
+
+        status_label = ttk.Label(frame, text="")
+        status_label.pack(side="left", pady=(10, 0))
+
+        def refresh():
+            if not perf_window.winfo_exists():
+                return
+            snapshot = metrics.snapshot()
+            rows = [(f"t:{name}", (name, t["count"], f"{t['mean_ms']:.2f}", f"{t['p50_ms']:.2f}",
+                                   f"{t['p95_ms']:.2f}", f"{t['p99_ms']:.2f}", f"{t['max_ms']:.2f}"))
+                    for name, t in snapshot["timings"].items()]
+            rows += [(f"c:{name}", (name, count, "", "", "", "", ""))
+                     for name, count in sorted(snapshot["counters"].items())]
+            if self.notifier is not None:
+                try:
+                    queue_counts = self.notifier.queue.counts()
+                except sqlite3.Error as e:
+                    logging.warning(f"Could not read the notification queue: {e}")
+                    queue_counts = {}
+                rows += [(f"q:{status}", (f"notifications.{status}", queue_counts.get(status, 0), "", "", "", "", ""))
+                         for status in ("pending", "sending", "sent", "failed")]
+            perf_sync.sync(rows)
+            status_label.configure(text=f"Collecting for {snapshot['uptime_s']:.0f} s. Percentiles are histogram bucket bounds.")
+            perf_window.after(METRICS_REFRESH_MS, refresh)
+
+        def reset():
+            metrics.reset()
+            perf_sync.clear()
+
+        def save_dump():
+            filepath = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")],
+                                                    initialfile=f"metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                                                    parent=perf_window)
+            if not filepath:
+                return
+            try:
+                metrics.dump(filepath)
+            except OSError as e:
+                messagebox.showerror("Save Error", f"Could not save metrics: {e}", parent=perf_window)
+
+        ttk.Button(frame, text="Save Dump", command=save_dump, bootstyle="primary").pack(side="right", pady=(10, 0))
+        ttk.Button(frame, text="Reset", command=reset, bootstyle="secondary-outline").pack(side="right", padx=10, pady=(10, 0))
+        refresh()
+
+    def run_in_background(self, work, on_done, on_error, on_poll=None):
+        # Runs work() on a background worker and reports back on the Tk thread
+        future = self.background.submit(work)
+
+        def poll():
+            if not future.done():
+                if on_poll is not None:
+                    on_poll()
+                self.after(BACKGROUND_POLL_MS, poll)
+            elif future.exception() is not None:
+                on_error(future.exception())
+            else:
+                on_done(future.result())
+        poll()
+
+    def purge_old_images(self):
+        days = self.image_config["retention_days"]
+        archive_dir = self.image_config["archive_dir"]
+        action = f"moved to {archive_dir}" if archive_dir else "permanently deleted"
+        if not messagebox.askyesno("Confirm", f"Face and license images older than {days} days will be {action}. Continue?"):
+            return
+
+        def on_done(purged):
+            messagebox.showinfo("Success", f"{purged} old image files were purged.")
+
+        def on_error(e):
+            logging.error(f"Image purge failed: {e}")
+            messagebox.showerror("Purge Error", f"An error occurred: {e}")
+
+        self.run_in_background(
+            lambda: purge_images(db, (self.face_store, self.license_store), days, archive_dir or None,
+                                 history_archive=self.history_archive),
+            on_done, on_error)
+
+    def archive_old_history(self):
+        days = kiosk_config["history_archive_days"]
+        if not messagebox.askyesno(
+                "Confirm", f"Closed visits from months older than {days} days will be moved to monthly archive files "
+                           f"in {self.history_archive.directory} and the database will be compacted. "
+                           "History searches and exports still include archived months.\n\n"
+                           "Compacting briefly locks the database, so run this while the kiosk is quiet. Continue?"):
+            return
+        archive_window = ttk.Toplevel(self)
+        archive_window.title("Archive Old History")
+        archive_window.geometry("400x150")
+        archive_window.transient(self)
+        frame = ttk.Frame(archive_window, padding=20)
+        frame.pack(fill="both", expand=True)
+        progress_bar = ttk.Progressbar(frame, mode="determinate", bootstyle="warning")
+        progress_bar.pack(fill="x")
+        status_label = ttk.Label(frame, text="Finding visits to archive...")
+        status_label.pack(pady=10)
+
+        # Written by the worker, read on the Tk thread
+        progress = {"done": 0, "total": 0}
+
+        def report(done, total):
+            progress["done"], progress["total"] = done, total
+
+        def show_progress():
+            if progress["total"] and archive_window.winfo_exists():
+                progress_bar.configure(maximum=progress["total"], value=progress["done"])
+                status_label.configure(text=f"{progress['done']} of {progress['total']} visits archived"
+                                       if progress["done"] < progress["total"] else "Compacting the database...")
+
+        def on_done(moved):
+            if archive_window.winfo_exists():
+                archive_window.destroy()
+            messagebox.showinfo("Success", f"{moved} visits were archived." if moved else "No visits were old enough to archive.")
+
+        def on_error(e):
+            if archive_window.winfo_exists():
+                archive_window.destroy()
+            logging.error(f"History archive failed: {e}")
+            messagebox.showerror("Archive Error", f"An error occurred: {e}")
+
+        self.run_in_background(lambda: archive_history(db, self.history_archive, days, progress=report),
+                               on_done, on_error, on_poll=show_progress)
+
+    def backfill_face_signatures(self):
+        if self.face_index is None:
+            return
+        backfill_window = ttk.Toplevel(self)
+        backfill_window.title("Backfill Face Signatures")
+        backfill_window.geometry("400x150")
+        backfill_window.transient(self)
+
+        frame = ttk.Frame(backfill_window, padding=20)
+        frame.pack(fill="both", expand=True)
+        progress_bar = ttk.Progressbar(frame, mode="determinate", bootstyle="success")
+        progress_bar.pack(fill="x")
+        status_label = ttk.Label(frame, text="Scanning visitor history...")
+        status_label.pack(pady=10)
+
+        # Written by the worker, read on the Tk thread
+        progress = {"done": 0, "total": 0}
+
+        def report(done, total):
+            progress["done"], progress["total"] = done, total
+
+        def show_progress():
+            if progress["total"] and backfill_window.winfo_exists():
+                progress_bar.configure(maximum=progress["total"], value=progress["done"])
+                status_label.configure(text=f"{progress['done']} of {progress['total']} images")
+
+        def on_done(result):
+            processed, found = result
+            if backfill_window.winfo_exists():
+                backfill_window.destroy()
+            messagebox.showinfo("Success", f"{processed} past face images processed, {found} signatures stored.")
+
+        def on_error(e):
+            if backfill_window.winfo_exists():
+                backfill_window.destroy()
+            logging.error(f"Face signature backfill failed: {e}")
+            messagebox.showerror("Backfill Error", f"An error occurred: {e}")
+
+        # Faces are decoded and hashed on a process pool started by the worker
+        self.run_in_background(lambda: backfill_signatures(self.face_index, progress=report),
+                               on_done, on_error, on_poll=show_progress)
+
     def export_history_to_csv(self):
-        filepath = filedialog.asksaveasfilename(
-            defaultextension=".csv", filetypes=[("CSV files", "*.csv")], title="Save Visitor History")
-        if not filepath: return
-        try:
-            conn = sqlite3.connect(BADGE_DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM visitor_history")
-            rows = cursor.fetchall()
-            headers = [d[0] for d in cursor.description]
-            with open(filepath, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(headers)
-                writer.writerows(rows)
-            messagebox.showinfo("Success", f"History exported to\n{filepath}")
-        except Exception as e:
-            messagebox.showerror("Export Error", f"An error occurred: {e}")
+        export_window = ttk.Toplevel(self)
+        export_window.title("Export Visitor History")
+        export_window.geometry("420x380")
+        export_window.transient(self)
+
+        frame = ttk.Frame(export_window, padding=20)
+        frame.pack(fill="both", expand=True)
+
+        filter_frame = ttk.Labelframe(frame, text="Filters (optional)", padding=15)
+        filter_frame.pack(fill="x")
+        filter_frame.columnconfigure(1, weight=1)
+        entries = {}
+        for row, (key, label) in enumerate([("start_date", "From (YYYY-MM-DD):"), ("end_date", "To (YYYY-MM-DD):"),
+                                            ("company", "Company:"), ("area", "Area:")]):
+            ttk.Label(filter_frame, text=label).grid(row=row, column=0, padx=5, pady=5, sticky="w")
+            entries[key] = ttk.Entry(filter_frame)
+            entries[key].grid(row=row, column=1, padx=5, pady=5, sticky="ew")
+
+        compress_var = tk.IntVar()
+        ttk.Checkbutton(frame, text="Compress (gzip)", variable=compress_var, bootstyle="primary").pack(pady=10)
+        progress_bar = ttk.Progressbar(frame, maximum=1, bootstyle="success-striped")
+        progress_bar.pack(fill="x", pady=5)
+        status_label = ttk.Label(frame, text="")
+        status_label.pack()
+
+        progress = {"done": 0, "total": 0}
+
+        def report(done, total):
+            progress["done"], progress["total"] = done, total
+
+        def show_progress():
+            if progress["total"] and export_window.winfo_exists():
+                progress_bar.configure(maximum=progress["total"], value=progress["done"])
+                status_label.configure(text=f"{progress['done']} of {progress['total']} rows")
+
+        def start():
+            compress = bool(compress_var.get())
+            ext = ".csv.gz" if compress else ".csv"
+            filepath = filedialog.asksaveasfilename(
+                parent=export_window, defaultextension=ext,
+                filetypes=[("Gzipped CSV files", "*.csv.gz")] if compress else [("CSV files", "*.csv")],
+                title="Save Visitor History")
+            if not filepath: return
+            filters = {key: entry.get().strip() or None for key, entry in entries.items()}
+            export_button.configure(state="disabled")
+            status_label.configure(text="Exporting...")
+
+            def on_done(written):
+                if export_window.winfo_exists():
+                    export_window.destroy()
+                messagebox.showinfo("Success", f"{written} rows exported to\n{filepath}")
+
+            def on_error(e):
+                logging.error(f"History export failed: {e}")
+                if not export_window.winfo_exists():
+                    messagebox.showerror("Export Error", f"An error occurred: {e}")
+                    return
+                export_button.configure(state="normal")
+                status_label.configure(text="")
+                messagebox.showerror("Export Error", f"An error occurred: {e}", parent=export_window)
+
+            self.run_in_background(
+                lambda: export_history(db, filepath, compress=compress, progress=report,
+                                       archive=self.history_archive, **filters),
+                on_done, on_error, on_poll=show_progress)
+
+        export_button = ttk.Button(frame, text="Export", command=start, bootstyle="primary")
+        export_button.pack(pady=10)
+
+    def history_browser_window(self):
+        history_window = ttk.Toplevel(self)
+        history_window.title("Visitor History")
+        history_window.geometry("1200x600")
+        history_window.transient(self)
+
+        frame = ttk.Frame(history_window, padding=15)
+        frame.pack(fill="both", expand=True)
+
+        filter_frame = ttk.Labelframe(frame, text="Search", padding=10)
+        filter_frame.pack(fill="x")
+        entries = {}
+        fields = [("start_date", "From (YYYY-MM-DD):"), ("end_date", "To (YYYY-MM-DD):"), ("text", "Text:"),
+                  ("name", "Name:"), ("company", "Company:"), ("area", "Area:"), ("badge_id", "Badge ID:")]
+        for i, (key, label) in enumerate(fields):
+            row, col = divmod(i, 3)
+            ttk.Label(filter_frame, text=label).grid(row=row, column=col * 2, padx=5, pady=5, sticky="e")
+            entries[key] = ttk.Entry(filter_frame, width=18)
+            entries[key].grid(row=row, column=col * 2 + 1, padx=5, pady=5, sticky="w")
+            entries[key].bind("<Return>", lambda e: run_search())
+
+        cols = ("Name", "Company", "Badge ID", "Area", "Reason of Visit", "Time In", "Time Out")
+        tree_frame = ttk.Frame(frame)
+        tree_frame.pack(fill="both", expand=True, pady=10)
+        thumbnail_pane = ThumbnailPane(tree_frame, self.thumbnails)
+        thumbnail_pane.pack(side="right", fill="y", padx=(10, 0))
+        history_tree = ttk.Treeview(tree_frame, columns=cols, show="headings", bootstyle="primary")
+        for col in cols:
+            history_tree.heading(col, text=col)
+            history_tree.column(col, width=130)
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=history_tree.yview)
+        history_tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        status_label = ttk.Label(frame, text="")
+        status_label.pack(side="left")
+        more_button = ttk.Button(frame, text="Load More", bootstyle="secondary-outline")
+        more_button.pack(side="right")
+
+        state = {"filters": {}, "next_key": None, "loaded": 0}
+        # Row id -> (face_file, driver_license_file) for the detail pane
+        image_paths = {}
+
+        def show_thumbnails(event=None):
+            selection = history_tree.selection()
+            if not selection:
+                thumbnail_pane.clear()
+                return
+            thumbnail_pane.show(*image_paths.get(selection[0], (None, None)))
+            self.thumbnails.prefetch(path for iid in neighbour_rows(history_tree, selection[0])
+                                     for path in image_paths.get(iid, ()))
+
+        def load_page():
+            try:
+                rows, state["next_key"] = query_history(db, after=state["next_key"], archive=self.history_archive,
+                                                        **state["filters"])
+            except Exception as e:
+                logging.error(f"History query failed: {e}")
+                messagebox.showerror("Search Error", f"An error occurred: {e}", parent=history_window)
+                return
+            for row in rows:
+                history_tree.insert("", "end", iid=row[0], values=(row[1], row[2], row[3], row[5], row[4], row[6], row[7]))
+                image_paths[str(row[0])] = (row[8], row[9])
+            state["loaded"] += len(rows)
+            more = state["next_key"] is not None
+            more_button.configure(state="normal" if more else "disabled")
+            status_label.configure(text=f"{state['loaded']} visits shown" + (" (more available)" if more else ""))
+
+        def run_search():
+            state["filters"] = {key: entry.get().strip() or None for key, entry in entries.items()}
+            state["next_key"], state["loaded"] = None, 0
+            history_tree.delete(*history_tree.get_children())
+            image_paths.clear()
+            thumbnail_pane.clear()
+            load_page()
+
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            # Fetch the next page as the user nears the end of what is loaded
+            if float(last) >= 0.95 and state["next_key"] is not None:
+                history_window.after_idle(load_page_once)
+
+        def load_page_once():
+            if state["next_key"] is not None and float(history_tree.yview()[1]) >= 0.95:
+                load_page()
+
+        history_tree.configure(yscrollcommand=on_scroll)
+        history_tree.bind("<<TreeviewSelect>>", show_thumbnails)
+        more_button.configure(command=load_page)
+        ttk.Button(filter_frame, text="Search", command=run_search, bootstyle="primary").grid(
+            row=2, column=3, padx=5, pady=5, sticky="w")
+        run_search()
 
     def checkout_all_guests(self):
-        if not self.records:
+        if not self.core.visits:
             messagebox.showinfo("Info", "No guests are currently checked in.")
             return
         if messagebox.askyesno("Confirm", "Check out all currently active guests?"):
             time_out = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            for record in list(self.records):
-                self.log_to_history(record, time_out)
-                self.records.remove(record)
-            self.save_records()
+            try:
+                self.core.check_out_all(time_out)
+            except Exception as e:
+                logging.error(f"Failed to log bulk checkout to history: {e}")
+                messagebox.showerror("Database Error", f"Guests were not checked out: {e}")
+                return
             self.update_treeview()
             self.update_available_badges()
             messagebox.showinfo("Success", "All guests have been checked out.")
 
+    def import_preregistered_guests(self):
+        filepath = filedialog.askopenfilename(
+            filetypes=[("CSV files", "*.csv")], title="Import Pre-Registered Guests")
+        if not filepath: return
+        time_in = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        records, claimed, skipped = [], set(), []
+        try:
+            with open(filepath, 'r', newline='', encoding='utf-8-sig') as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    line_no = reader.line_num
+                    # DictReader collects fields beyond the header under None
+                    if row.pop(None, None) is not None:
+                        skipped.append(f"line {line_no}: more fields than the header")
+                        continue
+                    row = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+                    name, reason = row.get("name", ""), row.get("reason_of_visit", "")
+                    badge_id = row.get("badge_id", "")
+                    if not name or not reason:
+                        skipped.append(f"line {line_no}: name and reason_of_visit are required")
+                        continue
+                    if badge_id and (badge_id in claimed or not self.core.badge_available(badge_id)):
+                        skipped.append(f"line {line_no}: badge {badge_id} is unknown or not available")
+                        continue
+                    if badge_id:
+                        claimed.add(badge_id)
+                    records.append(VisitRecord(
+                        id=str(uuid.uuid4()), name=name, company=row.get("company", ""), badge_id=badge_id,
+                        reason_of_visit=reason, area=row.get("area", ""), time_in=time_in))
+        except Exception as e:
+            messagebox.showerror("Import Error", f"An error occurred: {e}")
+            return
+
+        try:
+            accepted = self.core.check_in_many(records)
+        except Exception as e:
+            logging.error(f"Failed to import pre-registered guests: {e}")
+            messagebox.showerror("Database Error", f"Guests were not checked in: {e}")
+            return
+        if len(accepted) < len(records):
+            skipped.append(f"{len(records) - len(accepted)} guests whose badge was just issued at another station")
+        self.update_treeview()
+        self.update_available_badges()
+
+        message = f"{len(accepted)} pre-registered guests checked in."
+        if skipped:
+            logging.warning(f"Pre-registration import skipped rows: {skipped}")
+            message += f"\n{len(skipped)} rows were skipped:\n" + "\n".join(skipped[:10])
+        messagebox.showinfo("Import Complete", message)
+
     def badge_inventory_window(self):
         self.inv_window = ttk.Toplevel(self)
         self.inv_window.title("Badge Inventory")
-        self.inv_window.geometry("550x500")
+        self.inv_window.geometry("650x620")
         self.inv_window.transient(self)
 
         frame = ttk.Frame(self.inv_window, padding=15)
@@ -382,7 +1123,7 @@ class GuestCheckInApp(ttk.Window):
         ttk.Label(input_frame, text="Category:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
         self.category_var = tk.StringVar()
         self.inv_category_combo = ttk.Combobox(input_frame, textvariable=self.category_var, 
-                                           values=["Visitor", "Contractor", "Temporary"],
+                                           values=BADGE_CATEGORIES,
                                            state="readonly")
         self.inv_category_combo.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         self.inv_category_combo.current(0)
@@ -394,19 +1135,39 @@ class GuestCheckInApp(ttk.Window):
         log_badge_button = ttk.Button(input_frame, text="Log Badge", command=self.log_badge, bootstyle="success")
         log_badge_button.grid(row=2, column=0, columnspan=2, pady=10)
 
+        ttk.Label(input_frame, text="Range (e.g. V-001 to V-500):").grid(row=3, column=0, padx=5, pady=5, sticky="w")
+        range_frame = ttk.Frame(input_frame)
+        range_frame.grid(row=3, column=1, padx=5, pady=5, sticky="ew")
+        self.inv_range_start_entry = ttk.Entry(range_frame, width=12)
+        self.inv_range_start_entry.pack(side="left")
+        ttk.Label(range_frame, text="to").pack(side="left", padx=5)
+        self.inv_range_end_entry = ttk.Entry(range_frame, width=12)
+        self.inv_range_end_entry.pack(side="left")
+        ttk.Button(range_frame, text="Add Range", command=self.log_badge_range,
+                   bootstyle="success-outline").pack(side="left", padx=10)
+        input_frame.columnconfigure(1, weight=1)
+
         display_frame = ttk.Labelframe(frame, text="Existing Badges", padding=15)
         display_frame.pack(fill="both", expand=True, pady=10)
 
-        self.badge_tree = ttk.Treeview(display_frame, columns=("ID", "Badge Number", "Category", "Created At"), show="headings", bootstyle="primary")
+        self.badge_tree = ttk.Treeview(display_frame, columns=("ID", "Badge Number", "Category", "Status", "Created At"), show="headings", bootstyle="primary")
         self.badge_tree.heading("ID", text="ID")
         self.badge_tree.heading("Badge Number", text="Badge Number")
         self.badge_tree.heading("Category", text="Category")
+        self.badge_tree.heading("Status", text="Status")
         self.badge_tree.heading("Created At", text="Created At")
+        for col, width in (("ID", 50), ("Badge Number", 130), ("Category", 100), ("Status", 90), ("Created At", 150)):
+            self.badge_tree.column(col, width=width)
         self.badge_tree.pack(fill="both", expand=True)
+        self.badge_tree_sync = TreeSync(self.badge_tree)
 
         self.inv_category_combo.bind("<<ComboboxSelected>>", lambda e: self.update_badge_tree())
 
         self.badge_context_menu = tk.Menu(self.inv_window, tearoff=0)
+        self.badge_context_menu.add_command(label="Mark Available", command=lambda: self.set_badge_status("available"))
+        self.badge_context_menu.add_command(label="Mark Lost", command=lambda: self.set_badge_status("lost"))
+        self.badge_context_menu.add_command(label="Mark Retired", command=lambda: self.set_badge_status("retired"))
+        self.badge_context_menu.add_separator()
         self.badge_context_menu.add_command(label="Delete Badge", command=self.delete_badge)
         self.badge_tree.bind("<Button-3>", self.show_badge_context_menu)
 
@@ -420,31 +1181,49 @@ class GuestCheckInApp(ttk.Window):
             return
 
         try:
-            conn = sqlite3.connect(BADGE_DB_PATH)
-            c = conn.cursor()
-            c.execute("INSERT INTO badges (badge_number, category) VALUES (?, ?)", (badge_number, category))
-            conn.commit()
-            conn.close()
+            db.insert_badge(badge_number, category)
             messagebox.showinfo("Success", "Badge logged successfully.", parent=self.inv_window)
             self.inv_badge_number_entry.delete(0, tk.END)
-            self.update_badge_tree()
-            self.update_available_badges()
+            self.badges_changed()
         except sqlite3.IntegrityError:
             messagebox.showerror("Error", "This badge number already exists.", parent=self.inv_window)
         except Exception as e:
             logging.error(f"Error logging badge: {e}")
             messagebox.showerror("Database Error", f"An error occurred: {e}", parent=self.inv_window)
 
+    def log_badge_range(self):
+        category = self.category_var.get()
+        try:
+            numbers = expand_badge_range(self.inv_range_start_entry.get(), self.inv_range_end_entry.get())
+        except ValueError as e:
+            messagebox.showwarning("Input Error", str(e), parent=self.inv_window)
+            return
+        if not messagebox.askyesno("Confirm", f"Add {len(numbers)} {category} badges ({numbers[0]} to {numbers[-1]})?",
+                                   parent=self.inv_window):
+            return
+        try:
+            added = db.insert_badges(numbers, category)
+        except Exception as e:
+            logging.error(f"Error logging badge range: {e}")
+            messagebox.showerror("Database Error", f"An error occurred: {e}", parent=self.inv_window)
+            return
+        message = f"{added} badges added."
+        if added < len(numbers):
+            message += f"\n{len(numbers) - added} already existed and were skipped."
+        messagebox.showinfo("Success", message, parent=self.inv_window)
+        self.inv_range_start_entry.delete(0, tk.END)
+        self.inv_range_end_entry.delete(0, tk.END)
+        self.badges_changed()
+
+    def badges_changed(self):
+        self.core.reload_badges()
+        self.update_badge_tree()
+        self.update_available_badges()
+
     def update_badge_tree(self):
         category = self.category_var.get()
-        self.badge_tree.delete(*self.badge_tree.get_children())
         try:
-            conn = sqlite3.connect(BADGE_DB_PATH)
-            c = conn.cursor()
-            c.execute("SELECT id, badge_number, category, created_at FROM badges WHERE category = ? ORDER BY created_at DESC", (category,))
-            for row in c.fetchall():
-                self.badge_tree.insert("", "end", values=row)
-            conn.close()
+            self.badge_tree_sync.sync((row[0], row) for row in db.badges_in_category(category))
         except Exception as e:
             logging.error(f"Error fetching badges: {e}")
 
@@ -462,17 +1241,28 @@ class GuestCheckInApp(ttk.Window):
         badge_id = self.badge_tree.item(selected_item, "values")[0]
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this badge?", parent=self.inv_window):
             try:
-                conn = sqlite3.connect(BADGE_DB_PATH)
-                c = conn.cursor()
-                c.execute("DELETE FROM badges WHERE id = ?", (badge_id,))
-                conn.commit()
-                conn.close()
-                self.update_badge_tree()
-                self.update_available_badges()
+                if not db.delete_badge(badge_id):
+                    messagebox.showwarning("Badge Issued", "This badge is issued to a checked-in guest and cannot be deleted.",
+                                           parent=self.inv_window)
+                self.badges_changed()
             except Exception as e:
                 logging.error(f"Error deleting badge: {e}")
                 messagebox.showerror("Database Error", "Failed to delete badge.", parent=self.inv_window)
 
+    def set_badge_status(self, status):
+        selected_item = self.badge_tree.selection()
+        if not selected_item:
+            return
+        badge_id = self.badge_tree.item(selected_item, "values")[0]
+        try:
+            if not db.set_badge_status(badge_id, status):
+                messagebox.showwarning("Badge Issued", "This badge is issued to a checked-in guest. Check the guest out first.",
+                                       parent=self.inv_window)
+            self.badges_changed()
+        except Exception as e:
+            logging.error(f"Error updating badge status: {e}")
+            messagebox.showerror("Database Error", "Failed to update badge.", parent=self.inv_window)
+
     def open_smtp_settings(self):
         self.smtp_window = ttk.Toplevel(self)
         self.smtp_window.title("SMTP Settings")
@@ -0,0 +1,229 @@
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+BATCH_SIZE = 20
+COALESCE_SECONDS = 0.5
+POLL_SECONDS = 5
+# Keeps the worker from spinning if a due message cannot be rescheduled
+MIN_WAIT_SECONDS = 1
+SMTP_IDLE_SECONDS = 60
+SMTP_TIMEOUT = 30
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+# How long a claimed batch stays reserved; longer than the slowest batch can take
+CLAIM_LEASE_SECONDS = BATCH_SIZE * SMTP_TIMEOUT + 60
+
+
+class NotificationQueue:
+    """Outgoing emails persisted in badge_inventory.db until they are sent.
+
+    Several stations can share one queue: a worker claims rows by marking
+    them 'sending' under a lease before it sends them, so each message goes
+    out once however many stations run a worker. Rows claimed by a worker
+    that died are picked up again when the lease runs out.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        with db.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS notification_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient TEXT NOT NULL, subject TEXT, body TEXT, attachment TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    claimed_by TEXT,
+                    claimed_until REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(notification_queue)")}
+            if "claimed_by" not in columns:
+                # Queues from before claims
+                conn.execute("ALTER TABLE notification_queue ADD COLUMN claimed_by TEXT")
+                conn.execute("ALTER TABLE notification_queue ADD COLUMN claimed_until REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_notification_due "
+                         "ON notification_queue (status, next_attempt_at)")
+
+    def enqueue(self, recipient, subject, body, attachment=None):
+        self.db.execute(
+            "INSERT INTO notification_queue (recipient, subject, body, attachment) VALUES (?, ?, ?, ?)",
+            (recipient, subject, body, attachment))
+
+    def claim(self, owner, limit=BATCH_SIZE, lease=CLAIM_LEASE_SECONDS):
+        """Reserve up to limit due messages for owner and return them."""
+        now = time.time()
+        with self.db.transaction(immediate=True) as conn:
+            rows = conn.execute(
+                "SELECT id, recipient, subject, body, attachment, attempts FROM notification_queue "
+                "WHERE (status = 'pending' AND next_attempt_at <= ?) "
+                "   OR (status = 'sending' AND claimed_until <= ?) "
+                "ORDER BY next_attempt_at, id LIMIT ?",
+                (now, now, limit)).fetchall()
+            conn.executemany(
+                "UPDATE notification_queue SET status = 'sending', claimed_by = ?, claimed_until = ? WHERE id = ?",
+                [(owner, now + lease, row[0]) for row in rows])
+        return rows
+
+    def next_due_at(self):
+        row = self.db.query(
+            "SELECT MIN(CASE status WHEN 'pending' THEN next_attempt_at ELSE claimed_until END) "
+            "FROM notification_queue WHERE status IN ('pending', 'sending')")
+        return row[0][0]
+
+    def mark_sent(self, ids):
+        with self.db.transaction() as conn:
+            conn.executemany("UPDATE notification_queue SET status = 'sent', last_error = NULL, "
+                             "claimed_by = NULL, claimed_until = NULL WHERE id = ?",
+                             [(i,) for i in ids])
+
+    def mark_failed(self, message_id, attempts, error):
+        if attempts >= MAX_ATTEMPTS:
+            self.db.execute(
+                "UPDATE notification_queue SET status = 'failed', attempts = ?, last_error = ?, "
+                "claimed_by = NULL, claimed_until = NULL WHERE id = ?",
+                (attempts, error, message_id))
+            logging.error(f"Giving up on notification {message_id} after {attempts} attempts: {error}")
+            return
+        delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+        self.db.execute(
+            "UPDATE notification_queue SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ?, "
+            "claimed_by = NULL, claimed_until = NULL WHERE id = ?",
+            (attempts, time.time() + delay, error, message_id))
+
+    def counts(self):
+        return dict(self.db.query("SELECT status, COUNT(*) FROM notification_queue GROUP BY status"))
+
+
+def build_message(sender, recipient, subject, body, attachment=None):
+    msg = MIMEMultipart()
+    msg["From"] = sender
+    msg["To"] = recipient
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body, "plain"))
+    if attachment and os.path.exists(attachment):
+        part = MIMEBase("application", "octet-stream")
+        with open(attachment, "rb") as f:
+            part.set_payload(f.read())
+        encoders.encode_base64(part)
+        part.add_header("Content-Disposition", f"attachment; filename={os.path.basename(attachment)}")
+        msg.attach(part)
+    return msg
+
+
+class NotificationWorker:
+    """Background sender for the notification queue.
+
+    Keeps one authenticated SMTP connection open while there is mail to
+    send, waits briefly after a wake-up so bursts of check-ins go out
+    together, and retries failures with exponential backoff.
+    settings() must return (server, port, sender_email, sender_password).
+    """
+
+    def __init__(self, queue, settings):
+        self.queue = queue
+        self.settings = settings
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # Identifies this station's claims in a shared queue
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._smtp = None
+        self._smtp_settings = None
+        self._last_sent = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def notify(self, recipient, subject, body, attachment=None):
+        self.queue.enqueue(recipient, subject, body, attachment)
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            next_due = self.queue.next_due_at()
+            timeout = POLL_SECONDS if next_due is None else max(MIN_WAIT_SECONDS, min(POLL_SECONDS, next_due - time.time()))
+            if self._wake.wait(timeout):
+                self._wake.clear()
+                # Let a burst of check-ins accumulate before sending
+                self._stop.wait(COALESCE_SECONDS)
+            try:
+                while not self._stop.is_set() and self._send_batch():
+                    pass
+            except Exception as e:
+                logging.error(f"Notification worker error: {e}")
+            if self._smtp is not None and time.monotonic() - self._last_sent > SMTP_IDLE_SECONDS:
+                self._disconnect()
+        self._disconnect()
+
+    def _send_batch(self):
+        batch = self.queue.claim(self.owner)
+        if not batch:
+            return False
+        sent = []
+        for message_id, recipient, subject, body, attachment, attempts in batch:
+            try:
+                smtp = self._connection()
+                sender = self._smtp_settings[2]
+                smtp.send_message(build_message(sender, recipient, subject, body, attachment))
+                sent.append(message_id)
+                self._last_sent = time.monotonic()
+            except Exception as e:
+                logging.warning(f"Failed to send notification {message_id} to {recipient}: {e}")
+                self._disconnect()
+                self.queue.mark_failed(message_id, attempts + 1, str(e))
+        if sent:
+            self.queue.mark_sent(sent)
+            logging.info(f"Sent {len(sent)} host notifications.")
+        return len(sent) == len(batch)
+
+    def _connection(self):
+        settings = tuple(self.settings())
+        if self._smtp is not None and settings != self._smtp_settings:
+            self._disconnect()
+        if self._smtp is None:
+            server, port, sender, password = settings
+            port = int(port)
+            if port == 465:
+                smtp = smtplib.SMTP_SSL(server, port, timeout=SMTP_TIMEOUT)
+            else:
+                smtp = smtplib.SMTP(server, port, timeout=SMTP_TIMEOUT)
+                smtp.ehlo()
+                if smtp.has_extn("starttls"):
+                    smtp.starttls()
+                    smtp.ehlo()
+                elif password:
+                    # Never send the mailbox password over an unencrypted connection
+                    smtp.close()
+                    raise smtplib.SMTPNotSupportedError(
+                        f"{server}:{port} does not offer STARTTLS; refusing to log in without TLS.")
+            if password and smtp.has_extn("auth"):
+                smtp.login(sender, password)
+            self._smtp, self._smtp_settings = smtp, settings
+        return self._smtp
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
@@ -0,0 +1,140 @@
+"""Traffic rollups maintained alongside check-ins and check-outs.
+
+traffic_hourly holds check-ins, check-outs and visit minutes per hour, area
+and company; area_occupancy holds how many guests are on site per area.
+Both are updated in the same transaction as the visit change they count,
+so reports read a few hundred rollup rows instead of scanning
+visitor_history.
+"""
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_UPSERT_HOURLY_SQL = """
+    INSERT INTO traffic_hourly (hour, area, company, check_ins, check_outs, visit_minutes)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (hour, area, company) DO UPDATE SET
+        check_ins = check_ins + excluded.check_ins,
+        check_outs = check_outs + excluded.check_outs,
+        visit_minutes = visit_minutes + excluded.visit_minutes
+"""
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS traffic_hourly (
+            hour TEXT NOT NULL, area TEXT NOT NULL, company TEXT NOT NULL,
+            check_ins INTEGER NOT NULL DEFAULT 0,
+            check_outs INTEGER NOT NULL DEFAULT 0,
+            visit_minutes REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, area, company)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS area_occupancy (
+            area TEXT PRIMARY KEY, present INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE TABLE IF NOT EXISTS rollup_state (name TEXT PRIMARY KEY, value TEXT)")
+
+
+def _hour(timestamp):
+    # "YYYY-MM-DD HH"
+    return (timestamp or "")[:13]
+
+
+def _minutes(time_in, time_out):
+    try:
+        delta = datetime.strptime(time_out, TIME_FORMAT) - datetime.strptime(time_in, TIME_FORMAT)
+    except (TypeError, ValueError):
+        return 0.0
+    return max(0.0, delta.total_seconds() / 60)
+
+
+def record_check_ins(conn, records):
+    """Count new visits; call inside the transaction that stores them."""
+    hourly, areas = Counter(), Counter()
+    for record in records:
+        hourly[(_hour(record.time_in), record.area or "", record.company or "")] += 1
+        areas[record.area or ""] += 1
+    conn.executemany(_UPSERT_HOURLY_SQL, [key + (n, 0, 0.0) for key, n in hourly.items()])
+    conn.executemany("INSERT INTO area_occupancy (area, present) VALUES (?, ?) "
+                     "ON CONFLICT (area) DO UPDATE SET present = present + excluded.present",
+                     list(areas.items()))
+
+
+def record_check_outs(conn, records, time_out):
+    """Count closed visits; call inside the transaction that writes their history."""
+    hourly, minutes, areas = Counter(), Counter(), Counter()
+    for record in records:
+        key = (_hour(time_out), record.area or "", record.company or "")
+        hourly[key] += 1
+        minutes[key] += _minutes(record.time_in, time_out)
+        areas[record.area or ""] += 1
+    conn.executemany(_UPSERT_HOURLY_SQL, [key + (0, n, minutes[key]) for key, n in hourly.items()])
+    conn.executemany("UPDATE area_occupancy SET present = MAX(0, present - ?) WHERE area = ?",
+                     [(n, area) for area, n in areas.items()])
+
+
+def sync_occupancy(conn, active_records):
+    """Reset occupancy to the given active visits (the station's source of truth)."""
+    conn.execute("DELETE FROM area_occupancy")
+    areas = Counter(record.area or "" for record in active_records)
+    conn.executemany("INSERT INTO area_occupancy (area, present) VALUES (?, ?)", list(areas.items()))
+
+
+def backfill(conn, active_records):
+    """Build traffic_hourly from visitor_history once. Returns True if it ran."""
+    if conn.execute("SELECT 1 FROM rollup_state WHERE name = 'backfilled'").fetchone():
+        return False
+    start = time.perf_counter()
+    conn.execute("DELETE FROM traffic_hourly")
+    # "WHERE true" keeps SQLite from reading ON CONFLICT as a join constraint
+    conn.execute('''
+        INSERT INTO traffic_hourly (hour, area, company, check_ins)
+        SELECT substr(time_in, 1, 13), COALESCE(area, ''), COALESCE(company, ''), COUNT(*)
+        FROM visitor_history WHERE true
+        GROUP BY 1, 2, 3
+        ON CONFLICT (hour, area, company) DO UPDATE SET check_ins = check_ins + excluded.check_ins
+    ''')
+    conn.execute('''
+        INSERT INTO traffic_hourly (hour, area, company, check_outs, visit_minutes)
+        SELECT substr(time_out, 1, 13), COALESCE(area, ''), COALESCE(company, ''), COUNT(*),
+               COALESCE(SUM(MAX(0, (julianday(time_out) - julianday(time_in)) * 1440)), 0)
+        FROM visitor_history WHERE time_out IS NOT NULL AND time_out != ''
+        GROUP BY 1, 2, 3
+        ON CONFLICT (hour, area, company) DO UPDATE SET
+            check_outs = check_outs + excluded.check_outs,
+            visit_minutes = visit_minutes + excluded.visit_minutes
+    ''')
+    hourly = Counter((_hour(r.time_in), r.area or "", r.company or "") for r in active_records)
+    conn.executemany(_UPSERT_HOURLY_SQL, [key + (n, 0, 0.0) for key, n in hourly.items()])
+    conn.execute("INSERT INTO rollup_state (name, value) VALUES ('backfilled', ?)",
+                 (datetime.now().strftime(TIME_FORMAT),))
+    logging.info(f"Backfilled traffic rollups in {(time.perf_counter() - start) * 1000:.0f} ms.")
+    return True
+
+
+# --- Reports ---
+def occupancy(db):
+    return db.query("SELECT area, present FROM area_occupancy WHERE present > 0 ORDER BY present DESC, area")
+
+
+def traffic_report(db, start_date, end_date, period="day", by="area"):
+    """Rows of (period, group, check_ins, check_outs, average_minutes) between two YYYY-MM-DD dates.
+
+    period is "day" or "hour"; by is "area", "company" or None for totals.
+    """
+    period_sql = {"day": "substr(hour, 1, 10)", "hour": "hour"}[period]
+    group_sql = {"area": "area", "company": "company", None: "''"}[by]
+    rows = db.query(f'''
+        SELECT {period_sql}, {group_sql}, SUM(check_ins), SUM(check_outs), SUM(visit_minutes)
+        FROM traffic_hourly
+        WHERE hour BETWEEN ? AND ?
+        GROUP BY 1, 2
+        ORDER BY 1 DESC, 3 DESC
+    ''', (f"{start_date} 00", f"{end_date} 23"))
+    return [(p, g, ins, outs, round(minutes / outs, 1) if outs else 0.0) for p, g, ins, outs, minutes in rows]
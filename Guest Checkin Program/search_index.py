@@ -0,0 +1,77 @@
+SEARCH_FIELDS = ("name", "company", "badge_id", "area", "reason_of_visit")
+FIELD_SEPARATOR = "\x1f"
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """Trigram index for case-insensitive substring search over active visits.
+
+    Maintained incrementally as visits are added and removed. When a query
+    extends the previous one, only the previous matches are re-checked.
+    """
+
+    def __init__(self):
+        self._text = {}
+        self._order = {}
+        self._grams = {}
+        self._seq = 0
+        self._last_term = None
+        self._last_ids = None
+
+    def __len__(self):
+        return len(self._text)
+
+    def add(self, record):
+        if record.id in self._text:
+            self.remove(record.id)
+        text = FIELD_SEPARATOR.join((getattr(record, f) or "").lower() for f in SEARCH_FIELDS)
+        self._text[record.id] = text
+        self._order[record.id] = self._seq
+        self._seq += 1
+        for gram in _trigrams(text):
+            self._grams.setdefault(gram, set()).add(record.id)
+        if self._last_ids is not None and self._last_term in text:
+            self._last_ids.add(record.id)
+
+    def remove(self, record_id):
+        text = self._text.pop(record_id, None)
+        if text is None:
+            return
+        del self._order[record_id]
+        for gram in _trigrams(text):
+            ids = self._grams.get(gram)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del self._grams[gram]
+        if self._last_ids is not None:
+            self._last_ids.discard(record_id)
+
+    def clear(self):
+        self._text.clear()
+        self._order.clear()
+        self._grams.clear()
+        self._last_term = None
+        self._last_ids = None
+
+    def search(self, term):
+        """Return matching record ids in check-in order, or None for an empty term."""
+        term = term.lower()
+        if not term:
+            self._last_term, self._last_ids = None, None
+            return None
+
+        if self._last_ids is not None and term.startswith(self._last_term):
+            candidates = self._last_ids
+        elif len(term) >= 3:
+            postings = sorted((self._grams.get(g, ()) for g in _trigrams(term)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:]) if postings[0] else set()
+        else:
+            candidates = self._text.keys()
+
+        matches = {i for i in candidates if term in self._text[i]}
+        self._last_term, self._last_ids = term, matches
+        return sorted(matches, key=self._order.__getitem__)
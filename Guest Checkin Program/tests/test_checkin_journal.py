@@ -0,0 +1,114 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkin_core import DEFAULT_KIOSK_CONFIG, CheckInCore  # noqa: E402
+from database import Database  # noqa: E402
+from visit_store import VisitRecord  # noqa: E402
+
+COMPACT_EVERY = 3
+TIME_OUT = "2025-06-01 17:00:00"
+
+
+def open_core(workdir):
+    db = Database(os.path.join(workdir, "badge_inventory.db"))
+    db.init_schema()
+    core = CheckInCore(db, DEFAULT_KIOSK_CONFIG,
+                       os.path.join(workdir, "checkin_records.json"),
+                       os.path.join(workdir, "checkin_records.journal"))
+    core.backend.journal.compact_every = COMPACT_EVERY
+    core.load()
+    return core, db
+
+
+def restart(core, db, workdir):
+    core.close()
+    db.close()
+    return open_core(workdir)
+
+
+def visit(n):
+    return VisitRecord(id=f"visit-{n}", name=f"Guest {n}", reason_of_visit="Meeting",
+                       area="Office", time_in=f"2025-06-01 09:0{n}:00")
+
+
+def history_count(db):
+    return db.query("SELECT COUNT(*) FROM visitor_history")[0][0]
+
+
+def test_check_in_at_compaction_boundary_survives_restart(tmp_path):
+    core, db = open_core(str(tmp_path))
+    for n in range(COMPACT_EVERY):
+        core.check_in(visit(n))
+    core, db = restart(core, db, str(tmp_path))
+    assert sorted(r.id for r in core.visits) == [f"visit-{n}" for n in range(COMPACT_EVERY)]
+    core.close()
+    db.close()
+
+
+def test_check_in_many_and_check_out_at_compaction_boundary(tmp_path):
+    core, db = open_core(str(tmp_path))
+    core.check_in_many([visit(0), visit(1)])
+    core.check_out("visit-0", TIME_OUT)
+    core, db = restart(core, db, str(tmp_path))
+    assert [r.id for r in core.visits] == ["visit-1"]
+    core.close()
+    db.close()
+
+
+def test_check_out_all_at_compaction_boundary_survives_restart(tmp_path):
+    core, db = open_core(str(tmp_path))
+    core.check_in(visit(0))
+    core.check_in(visit(1))
+    assert core.check_out_all(TIME_OUT) == 2
+    core, db = restart(core, db, str(tmp_path))
+    assert len(core.visits) == 0
+    assert history_count(db) == 2
+    core.close()
+    db.close()
+
+
+def test_failed_journal_write_leaves_guest_checked_in(tmp_path, monkeypatch):
+    core, db = open_core(str(tmp_path))
+    db.insert_badges(["V-001"], "Visitor")
+    core.reload_badges()
+    record = visit(0)
+    record.badge_id = "V-001"
+    core.check_in(record)
+
+    def fail(*events):
+        raise OSError("disk full")
+    monkeypatch.setattr(core.backend.journal, "append", fail)
+    with pytest.raises(OSError):
+        core.check_out("visit-0", TIME_OUT)
+    monkeypatch.undo()
+    assert history_count(db) == 0
+    assert "visit-0" in core.visits and not core.badge_available("V-001")
+
+    core, db = restart(core, db, str(tmp_path))
+    assert [r.id for r in core.visits] == ["visit-0"]
+    assert not core.badge_available("V-001")
+    assert core.check_out("visit-0", TIME_OUT) is not None
+    assert history_count(db) == 1
+    core.close()
+    db.close()
+
+
+def test_failed_history_write_keeps_guest_after_restart(tmp_path, monkeypatch):
+    core, db = open_core(str(tmp_path))
+    core.check_in(visit(0))
+
+    def fail(*args):
+        raise OSError("database is locked")
+    monkeypatch.setattr(db, "insert_history", fail)
+    with pytest.raises(OSError):
+        core.check_out("visit-0", TIME_OUT)
+    monkeypatch.undo()
+    core, db = restart(core, db, str(tmp_path))
+    assert [r.id for r in core.visits] == ["visit-0"]
+    assert history_count(db) == 0
+    core.close()
+    db.close()
@@ -0,0 +1,201 @@
+import collections
+import logging
+import os
+import queue
+import threading
+
+import ttkbootstrap as ttk
+from PIL import Image, ImageTk
+
+from instrumentation import metrics
+
+THUMBNAIL_SIZE = 160
+THUMBNAIL_CACHE_SIZE = 128
+THUMBNAIL_POLL_MS = 30
+PREFETCH_ROWS = 5
+MAX_QUEUED = 32
+
+
+def decode_thumbnail(path, size, thumbnail_path=None):
+    """Decode an image scaled to fit size x size, preferring a pre-rendered thumbnail."""
+    source = thumbnail_path if thumbnail_path and os.path.exists(thumbnail_path) else path
+    with Image.open(source) as image:
+        # JPEG can decode straight to a reduced size, which skips most of the work
+        image.draft("RGB", (size, size))
+        image = image.convert("RGB")
+    image.thumbnail((size, size))
+    return image
+
+
+class ThumbnailCache:
+    """Bounded LRU of Tk thumbnails decoded on a background thread.
+
+    Files are decoded with PIL on a worker thread; the Tk thread turns the
+    results into PhotoImages, since Tk objects may only be created there.
+    The most recent request is decoded first so rows the user has moved
+    past do not hold up the one being looked at. At most max_items images
+    are kept, so memory stays capped however many rows are browsed.
+    """
+
+    def __init__(self, widget, resolve=None, size=THUMBNAIL_SIZE, max_items=THUMBNAIL_CACHE_SIZE):
+        self.widget = widget
+        self.resolve = resolve
+        self.size = size
+        self.max_items = max_items
+        self._cache = collections.OrderedDict()
+        self._callbacks = {}
+        self._queue = collections.deque()
+        self._results = queue.SimpleQueue()
+        self._wakeup = threading.Condition()
+        self._decoding = None
+        self._stopped = False
+        self._poll_job = None
+        self._thread = threading.Thread(target=self._run, name="thumbnails", daemon=True)
+        self._thread.start()
+
+    def get(self, path, callback):
+        """Call callback(photo) on the Tk thread; photo is None if there is no readable image.
+
+        Unreadable images are tried again on the next request.
+        """
+        if not path:
+            callback(None)
+            return
+        if path in self._cache:
+            self._cache.move_to_end(path)
+            callback(self._cache[path])
+            return
+        if path in self._callbacks:
+            self._callbacks[path].append(callback)
+            # Move it to the front of the line
+            self._enqueue(path)
+            return
+        self._callbacks[path] = [callback]
+        self._enqueue(path)
+
+    def prefetch(self, paths):
+        for path in paths:
+            if path and path not in self._cache and path not in self._callbacks:
+                self._callbacks[path] = []
+                self._enqueue(path)
+
+    def _enqueue(self, path):
+        with self._wakeup:
+            if path == self._decoding:
+                return
+            try:
+                self._queue.remove(path)
+            except ValueError:
+                pass
+            self._queue.append(path)
+            # Drop the oldest prefetches nobody is waiting for
+            while len(self._queue) > MAX_QUEUED:
+                stale = next((p for p in self._queue if not self._callbacks.get(p)), None)
+                if stale is None:
+                    break
+                self._queue.remove(stale)
+                self._callbacks.pop(stale, None)
+            self._wakeup.notify()
+        if self._poll_job is None:
+            self._poll_job = self.widget.after(THUMBNAIL_POLL_MS, self._poll)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._queue and not self._stopped:
+                    self._wakeup.wait()
+                if self._stopped:
+                    return
+                path = self._decoding = self._queue.pop()
+            try:
+                with metrics.timed("thumbnail.decode"):
+                    image = decode_thumbnail(path, self.size, self.resolve(path) if self.resolve else None)
+            except Exception as e:
+                logging.warning(f"Could not load thumbnail for {path}: {e}")
+                image = None
+            with self._wakeup:
+                self._decoding = None
+            self._results.put((path, image))
+
+    def _poll(self):
+        self._poll_job = None
+        while True:
+            try:
+                path, image = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if path not in self._callbacks:
+                # Dropped from the queue while it was being decoded
+                continue
+            photo = None
+            if image is not None:
+                photo = self._cache[path] = ImageTk.PhotoImage(image)
+                while len(self._cache) > self.max_items:
+                    self._cache.popitem(last=False)
+            # Failures are not cached: the file may only be missing until a
+            # shared folder syncs or a purge finishes moving it
+            for callback in self._callbacks.pop(path):
+                callback(photo)
+        if self._callbacks and not self._stopped:
+            self._poll_job = self.widget.after(THUMBNAIL_POLL_MS, self._poll)
+
+    def close(self):
+        with self._wakeup:
+            self._stopped = True
+            self._queue.clear()
+            self._wakeup.notify()
+        if self._poll_job is not None:
+            self.widget.after_cancel(self._poll_job)
+            self._poll_job = None
+        self._callbacks.clear()
+        self._cache.clear()
+
+
+def neighbour_rows(tree, iid, count=PREFETCH_ROWS):
+    """Up to count rows on each side of iid, nearest first."""
+    rows, before, after = [], iid, iid
+    for _ in range(count):
+        before = tree.prev(before) if before else ""
+        after = tree.next(after) if after else ""
+        rows.extend(r for r in (after, before) if r)
+    return rows
+
+
+class ThumbnailPane(ttk.Labelframe):
+    """Face and license thumbnails for the selected row of a Treeview."""
+
+    def __init__(self, parent, cache, text="Photos", **kwargs):
+        super().__init__(parent, text=text, padding=10, **kwargs)
+        self.cache = cache
+        self._current = (None, None)
+        # Hold the shown images so LRU eviction cannot blank the labels
+        self._shown = [None, None]
+        self._labels = []
+        for caption in ("Face", "License"):
+            ttk.Label(self, text=caption, font=("Helvetica", 10, "bold")).pack(anchor="w")
+            label = ttk.Label(self, text="-", width=22, anchor="center")
+            label.pack(pady=(0, 10))
+            self._labels.append(label)
+
+    def show(self, face_file, license_file):
+        paths = (face_file or None, license_file or None)
+        if paths == self._current:
+            return
+        self._current = paths
+        for slot, path in enumerate(paths):
+            self._labels[slot].configure(image="", text="Loading..." if path else "No image")
+            self._shown[slot] = None
+            if path:
+                self.cache.get(path, lambda photo, slot=slot, path=path: self._loaded(slot, path, photo))
+
+    def _loaded(self, slot, path, photo):
+        if self._current[slot] != path or not self.winfo_exists():
+            return
+        self._shown[slot] = photo
+        if photo is None:
+            self._labels[slot].configure(image="", text="Image unavailable")
+        else:
+            self._labels[slot].configure(image=photo, text="")
+
+    def clear(self):
+        self.show(None, None)
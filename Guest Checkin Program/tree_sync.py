@@ -0,0 +1,60 @@
+from instrumentation import metrics
+
+RENDER_BATCH_SIZE = 200
+RENDER_BATCH_DELAY_MS = 10
+
+
+class TreeSync:
+    """Reconciles a flat ttk.Treeview against a list of (iid, values) rows.
+
+    Only rows that were added, removed or changed touch the widget. Large
+    insertions are rendered in batches from the event loop so the first
+    screenful appears immediately and the rest streams in behind it.
+    """
+
+    def __init__(self, tree, batch_size=RENDER_BATCH_SIZE):
+        self.tree = tree
+        self.batch_size = batch_size
+        self._rows = {}
+        self._job = None
+
+    def sync(self, rows):
+        with metrics.timed("tree.refresh"):
+            self._sync(rows)
+
+    def _sync(self, rows):
+        if self._job is not None:
+            self.tree.after_cancel(self._job)
+            self._job = None
+        rows = [(str(iid), tuple(values)) for iid, values in rows]
+        wanted = dict(rows)
+
+        gone = [iid for iid in self._rows if iid not in wanted]
+        if gone:
+            self.tree.delete(*gone)
+            for iid in gone:
+                del self._rows[iid]
+
+        kept = [iid for iid, _ in rows if iid in self._rows]
+        if kept != list(self.tree.get_children()):
+            for index, iid in enumerate(kept):
+                self.tree.move(iid, "", index)
+        for iid in kept:
+            if self._rows[iid] != wanted[iid]:
+                self.tree.item(iid, values=wanted[iid])
+                self._rows[iid] = wanted[iid]
+
+        self._insert([(index, iid, values) for index, (iid, values) in enumerate(rows)
+                      if iid not in self._rows])
+
+    def _insert(self, pending):
+        self._job = None
+        # Ascending final positions, so each insert lands after everything before it
+        for index, iid, values in pending[:self.batch_size]:
+            self.tree.insert("", index, iid=iid, values=values)
+            self._rows[iid] = values
+        if len(pending) > self.batch_size:
+            self._job = self.tree.after(RENDER_BATCH_DELAY_MS, self._insert, pending[self.batch_size:])
+
+    def clear(self):
+        self.sync(())
@@ -0,0 +1,57 @@
+class VisitRecord:
+    __slots__ = ("id", "name", "company", "badge_id", "reason_of_visit", "area",
+                 "time_in", "face_file", "driver_license_file")
+
+    def __init__(self, id, name, company="", badge_id="", reason_of_visit="", area="",
+                 time_in="", face_file=None, driver_license_file=None):
+        self.id = id
+        self.name = name
+        self.company = company or ""
+        self.badge_id = badge_id or ""
+        self.reason_of_visit = reason_of_visit or ""
+        self.area = area or ""
+        self.time_in = time_in
+        self.face_file = face_file
+        self.driver_license_file = driver_license_file
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{k: data.get(k) for k in cls.__slots__ if k in data})
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class ActiveVisitStore:
+    """Currently checked-in visits keyed by id.
+
+    Iteration follows check-in order.
+    """
+
+    def __init__(self, records=()):
+        self._by_id = {}
+        for record in records:
+            self.add(record)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __contains__(self, record_id):
+        return record_id in self._by_id
+
+    def get(self, record_id):
+        return self._by_id.get(record_id)
+
+    def add(self, record):
+        # Re-adding moves the visit to the end, as a fresh check-in would
+        self._by_id.pop(record.id, None)
+        self._by_id[record.id] = record
+
+    def remove(self, record_id):
+        return self._by_id.pop(record_id, None)
+
+    def clear(self):
+        self._by_id.clear()